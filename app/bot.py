@@ -6,39 +6,85 @@
 
 from __future__ import annotations
 
+import asyncio
+
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
 
 from .config import Settings
 from .db import lifespan_db
 from .logger import setup_logging
-from .middlewares.db_session import DbSessionMiddleware
+from .middlewares.rate_limit import RateLimitMiddleware
+from .utils.activity import run_flusher
+from .utils.background import drain
+
 
-# handlers
-from .handlers.start import router as start_router
-from .handlers.profile import router as profile_router  # ← раньше
-from .handlers.registration import router as registration_router  # ← после анкеты
-from .handlers.admin import router as admin_router
+def make_bot_session(settings: Settings) -> AiohttpSession:
+    """
+    HTTP-сессия бота: пул соединений не меньше числа параллельных апдейтов;
+    при BOT_API_URL запросы идут в локальный Bot API сервер (без TLS до Telegram);
+    исходящие сообщения проходят через общий лимитер (RateLimitMiddleware).
+    """
+    api = (
+        TelegramAPIServer.from_base(settings.bot_api_url)
+        if settings.bot_api_url
+        else PRODUCTION
+    )
+    session = AiohttpSession(api=api, limit=max(100, settings.updates_concurrency))
+    session.middleware(RateLimitMiddleware())
+    return session
 
 
 async def create_dispatcher(settings: Settings) -> Dispatcher:
-    """Создаёт Dispatcher и регистрирует роутеры."""
+    """
+    Создаёт Dispatcher и регистрирует роутеры.
+    Хендлеры импортируются здесь, а не на уровне модуля: `import app.bot` остаётся лёгким.
+    """
+    from .handlers.start import router as start_router
+    from .handlers.profile import router as profile_router  # ← раньше
+    from .handlers.registration import router as registration_router  # ← после анкеты
+    from .handlers.admin import router as admin_router
+    from .utils.email_sender import close_smtp
+
     setup_logging(settings.log_level)
     dp = Dispatcher()
     dp.include_router(start_router)
     dp.include_router(profile_router)  # важно: анкета выше
     dp.include_router(registration_router)  # регистрация ниже
     dp.include_router(admin_router)
+    # при остановке дожидаемся фоновых уведомлений, пока БД и сессия бота живы
+    dp.shutdown.register(drain)
+    # затем закрываем переиспользуемое SMTP-соединение
+    dp.shutdown.register(close_smtp)
     return dp
 
 
 async def run_bot() -> None:
     """Точка запуска: инициализирует всё и стартует polling."""
+    from .handlers.admin import sync_admin_roles
+
     settings = Settings.load()
-    bot = Bot(token=settings.bot_token)
+    bot = Bot(token=settings.bot_token, session=make_bot_session(settings))
     dp = await create_dispatcher(settings)
 
     async with lifespan_db(settings) as session_factory:
-        dp.update.outer_middleware(DbSessionMiddleware(session_factory))
+        # фабрика и настройки — workflow data диспетчера: aiogram подмешивает их
+        # в kwargs хендлеров сам, без отдельной мидлвари на каждый апдейт
+        dp["session_factory"] = session_factory
         dp["settings"] = settings
+        await sync_admin_roles(session_factory, settings)
         await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot, settings=settings)
+        # last_activity пишется пачками в фоне; при остановке остаток дописывается
+        flusher = asyncio.create_task(run_flusher(session_factory))
+        try:
+            # каждый апдейт — отдельная задача; лимит не даёт выбрать весь пул БД
+            await dp.start_polling(
+                bot,
+                handle_as_tasks=True,
+                tasks_concurrency_limit=settings.updates_concurrency,
+                settings=settings,
+            )
+        finally:
+            flusher.cancel()
+            await asyncio.gather(flusher, return_exceptions=True)
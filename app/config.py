@@ -8,18 +8,22 @@
 - лимиты OTP/попыток,
 - общие настройки.
 
-Файл читает .env через python-dotenv (load_dotenv).
+Файл читает .env через python-dotenv (dotenv_values).
 """
 
 from __future__ import annotations
 
-import json
+import hashlib
 import os
 import re
 from dataclasses import dataclass
-from typing import Pattern, Set, List
+from functools import lru_cache
+from typing import FrozenSet, Pattern, Set, List, Tuple
 
-from dotenv import load_dotenv  # <— добавлено
+import orjson
+from dotenv import dotenv_values, find_dotenv  # <— добавлено
+
+_SPLIT_RE = re.compile(r"[,\s]+")
 
 
 def _parse_list(raw: str) -> List[str]:
@@ -29,28 +33,79 @@ def _parse_list(raw: str) -> List[str]:
     raw = raw.strip()
     if raw.startswith("["):
         try:
-            data = json.loads(raw)
+            data = orjson.loads(raw)
             if isinstance(data, list):
                 return [str(x).strip() for x in data if str(x).strip()]
         except Exception:
             pass
-    parts = re.split(r"[,\s]+", raw)
+    # без пробельных символов достаточно обычного split по запятой
+    if " " not in raw and raw.isprintable():
+        parts = raw.split(",")
+    else:
+        parts = _SPLIT_RE.split(raw)
     return [x.strip() for x in parts if x.strip()]
 
 
-@dataclass(frozen=True)
+def _env_bool(name: str, default: bool) -> bool:
+    """Читает флаг из окружения: 1/true/yes/on — True, пусто — default."""
+    raw = os.getenv(name, "").strip().lower()
+    if not raw:
+        return default
+    return raw in {"1", "true", "yes", "on"}
+
+
+@lru_cache(maxsize=4)
+def _compile_email(pattern: str) -> Pattern[str]:
+    """Компилирует регулярку e-mail один раз на каждое значение EMAIL_REGEX."""
+    return re.compile(pattern)
+
+
+def _env_mtime(path: str) -> int | None:
+    """mtime файла .env в наносекундах (часть ключа кэша); None — файла нет."""
+    if not path:
+        return None
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+# ключи, которые последний _apply_dotenv сам записал в os.environ
+_dotenv_keys: Set[str] = set()
+
+
+def _apply_dotenv(env_path: str) -> None:
+    """
+    Переносит .env в os.environ, не перекрывая переменные из окружения процесса
+    (Docker/systemd/CI). При перечитывании ключи, записанные прошлым вызовом,
+    сначала убираем: изменённые значения обновятся, удалённые из .env — исчезнут.
+    """
+    global _dotenv_keys
+    for key in _dotenv_keys:
+        os.environ.pop(key, None)
+    applied = set()
+    for key, value in dotenv_values(env_path).items():
+        if value is None or key in os.environ:
+            continue
+        os.environ[key] = value
+        applied.add(key)
+    _dotenv_keys = applied
+
+
+@dataclass(frozen=True, slots=True)
 class Settings:
     """Иммутабельные настройки приложения."""
 
     # Bot / Admin
     bot_token: str
-    admin_ids: Set[int]
+    admin_ids: FrozenSet[int]
     admin_chat_id: int | None
+    bot_api_url: str
 
     # Email checks
     email_regex_str: str
     email_regex: Pattern[str]
-    allowed_domains: Set[str]
+    allowed_domains: FrozenSet[str]
 
     # SMTP
     smtp_host: str
@@ -61,6 +116,11 @@ class Settings:
 
     # DB
     db_url: str
+    db_pool_size: int
+    db_max_overflow: int
+    db_pool_recycle: int
+    db_pgbouncer: bool
+    db_auto_create: bool
 
     # Limits / Flow
     otp_ttl_seconds: int
@@ -68,6 +128,8 @@ class Settings:
     resend_max_per_session: int
     email_max_attempts: int
     otp_max_attempts: int
+    otp_pepper: bytes  # ключ BLAKE2b для хешей OTP (64 байта, из OTP_PEPPER)
+    updates_concurrency: int
 
     # Matching (на будущее)
     min_jaccard: float
@@ -78,22 +140,44 @@ class Settings:
     # Misc
     log_level: str
     tz_default: str
-    banned_words: List[str]
+    banned_words: Tuple[str, ...]
+    banned_words_set: FrozenSet[str]  # в нижнем регистре, без пустых
 
     @classmethod
     def load(cls) -> "Settings":
+        """Возвращает настройки; .env перечитывается, только если файл изменился."""
+        path = find_dotenv()
+        return _load_cached(path, _env_mtime(path))
+
+    @classmethod
+    def reload(cls) -> "Settings":
+        """Сбрасывает кэш и перечитывает настройки (для тестов)."""
+        _load_cached.cache_clear()
+        return cls.load()
+
+    @classmethod
+    def _from_env(cls, env_path: str) -> "Settings":
         # ВАЖНО: загрузить .env из корня проекта
-        load_dotenv()  # <— теперь переменные из .env будут в os.environ
+        if env_path:
+            _apply_dotenv(env_path)
 
         bot_token = os.getenv("BOT_TOKEN", "").strip()
         if not bot_token:
             raise RuntimeError("BOT_TOKEN не задан в .env")
 
-        allowed_domains = set(_parse_list(os.getenv("ALLOWED_DOMAINS", "")))
+        # без секрета хеши 6-значных OTP из дампа БД перебираются за миллисекунды
+        otp_pepper = os.getenv("OTP_PEPPER", "").strip()
+        if not otp_pepper:
+            raise RuntimeError("OTP_PEPPER не задан в .env")
+
+        # домены в нижнем регистре: при проверке e-mail — одно обращение к множеству
+        allowed_domains = frozenset(
+            d.lower() for d in _parse_list(os.getenv("ALLOWED_DOMAINS", ""))
+        )
         email_regex_str = os.getenv(
             "EMAIL_REGEX", r"^[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}$"
         )
-        email_regex = re.compile(email_regex_str)
+        email_regex = _compile_email(email_regex_str)
 
         admin_ids: Set[int] = set()
         for x in _parse_list(os.getenv("ADMIN_IDS", "")):
@@ -109,11 +193,14 @@ class Settings:
         )
         admin_chat_id = int(admin_chat_id_env) if admin_chat_id_env else None
 
+        banned_words = tuple(_parse_list(os.getenv("BANNED_WORDS", "")))
+
         return cls(
             # bot/admin
             bot_token=bot_token,
-            admin_ids=admin_ids,
+            admin_ids=frozenset(admin_ids),
             admin_chat_id=admin_chat_id,
+            bot_api_url=os.getenv("BOT_API_URL", "").strip(),
             # email
             email_regex_str=email_regex_str,
             email_regex=email_regex,
@@ -126,12 +213,20 @@ class Settings:
             smtp_from=os.getenv("SMTP_FROM", os.getenv("SMTP_USER", "")),
             # db
             db_url=os.getenv("DB_URL", "sqlite+aiosqlite:///./data/app.db"),
+            db_pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+            db_max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "30")),
+            db_pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+            db_pgbouncer=_env_bool("DB_PGBOUNCER", False),
+            db_auto_create=_env_bool("DB_AUTO_CREATE", True),
             # limits
             otp_ttl_seconds=int(os.getenv("OTP_TTL_SECONDS", "120")),
             otp_cooldown_seconds=int(os.getenv("OTP_COOLDOWN_SECONDS", "120")),
             resend_max_per_session=int(os.getenv("RESEND_MAX_PER_SESSION", "3")),
             email_max_attempts=int(os.getenv("EMAIL_MAX_ATTEMPTS", "3")),
             otp_max_attempts=int(os.getenv("OTP_MAX_ATTEMPTS", "3")),
+            # ключ BLAKE2b — не длиннее 64 байт: секрет любой длины приводим хешем
+            otp_pepper=hashlib.blake2b(otp_pepper.encode()).digest(),
+            updates_concurrency=int(os.getenv("UPDATES_CONCURRENCY", "64")),
             # matching (на будущее)
             min_jaccard=float(os.getenv("MIN_JACCARD", "0.3")),
             cooldown_weeks=int(os.getenv("COOLDOWN_WEEKS", "1")),
@@ -140,5 +235,12 @@ class Settings:
             # misc
             log_level=os.getenv("LOG_LEVEL", "INFO"),
             tz_default=os.getenv("TZ_DEFAULT", "UTC"),
-            banned_words=_parse_list(os.getenv("BANNED_WORDS", "")),
+            banned_words=banned_words,
+            banned_words_set=frozenset(w.strip().lower() for w in banned_words) - {""},
         )
+
+
+@lru_cache(maxsize=1)
+def _load_cached(env_path: str, env_mtime: int | None) -> Settings:
+    """Кэш Settings.load(): ключ — путь к .env и его mtime."""
+    return Settings._from_env(env_path)
@@ -2,27 +2,121 @@
 """
 Инициализация асинхронной БД (SQLAlchemy 2.x, async).
 В dev по умолчанию — SQLite (aiosqlite), URL берётся из .env.
-Создание таблиц происходит автоматически при старте (для prod — миграции).
+Для PostgreSQL используется драйвер asyncpg.
+Таблицы создаются при старте, только если DB_AUTO_CREATE включён (dev);
+в prod схему ведут миграциями (Alembic), а DB_AUTO_CREATE=0.
 """
 
 from __future__ import annotations
 
+import asyncio
 from contextlib import asynccontextmanager
-from typing import AsyncIterator
+from typing import Any, AsyncIterator
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+import orjson
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from .config import Settings
 
+# Применяются к каждому новому соединению SQLite и живут вместе с ним в пуле
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA temp_store=MEMORY",
+    # чтение страниц через mmap (до 256 МБ) вместо read() в буфер страничного кэша
+    "PRAGMA mmap_size=268435456",
+)
+
+
+def _json_dumps(value: Any) -> str:
+    """JSON-колонки сериализуем через orjson (драйверы ждут str)."""
+    return orjson.dumps(value).decode()
+
+
+def _sqlite_on_connect(dbapi_conn, _record) -> None:
+    cursor = dbapi_conn.cursor()
+    for pragma in _SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def _connect_args(backend: str, settings: Settings) -> dict[str, Any]:
+    """Параметры драйвера для конкретного бэкенда."""
+    if backend == "sqlite":
+        # ждать снятия блокировки записи, а не падать сразу с "database is locked"
+        return {"timeout": 30}
+    if backend == "postgresql":
+        # JIT на коротких OLTP-запросах бота только добавляет задержку
+        args: dict[str, Any] = {"server_settings": {"jit": "off"}}
+        if settings.db_pgbouncer:
+            args["statement_cache_size"] = 0
+        return args
+    return {}
+
 
 def make_engine(settings: Settings):
-    """Создаёт AsyncEngine для SQLAlchemy."""
-    return create_async_engine(
-        settings.db_url,
+    """
+    Создаёт AsyncEngine для SQLAlchemy:
+    - postgresql:// приводится к драйверу asyncpg;
+    - пул AsyncAdaptedQueuePool, размер и recycle берутся из настроек (кроме
+      SQLite in-memory, где пул статический);
+    - для SQLite на каждом соединении включаются WAL, synchronous=NORMAL,
+      временные таблицы в памяти и mmap (см. _SQLITE_PRAGMAS);
+    - драйверу передаются connect_args бэкенда (см. _connect_args);
+    - JSON-колонки (де)сериализуются через orjson;
+    - кэш скомпилированного SQL увеличен до 1200 запросов (query_cache_size).
+    """
+    url = make_url(settings.db_url)
+    backend = url.get_backend_name()
+    if backend == "postgresql" and url.get_driver_name() != "asyncpg":
+        url = url.set(drivername="postgresql+asyncpg")
+
+    kwargs: dict = {}
+    if not (backend == "sqlite" and url.database in (None, "", ":memory:")):
+        kwargs.update(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_recycle=settings.db_pool_recycle,
+        )
+
+    engine = create_async_engine(
+        url,
         echo=False,
         future=True,
         pool_pre_ping=True,
+        # кэш скомпилированных запросов: модульные statement'ы хендлеров + ORM-загрузки
+        query_cache_size=1200,
+        json_serializer=_json_dumps,
+        json_deserializer=orjson.loads,
+        connect_args=_connect_args(backend, settings),
+        **kwargs,
     )
+    if backend == "sqlite":
+        event.listen(engine.sync_engine, "connect", _sqlite_on_connect)
+    return engine
+
+
+async def _warm_up_pool(engine: AsyncEngine, size: int) -> None:
+    """
+    Заранее открывает size соединений (SELECT 1) и возвращает их в пул:
+    первые апдейты после старта не ждут подключения и handshake.
+    """
+
+    async def ping() -> None:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(ping() for _ in range(size)))
 
 
 def make_session_factory(engine) -> async_sessionmaker[AsyncSession]:
@@ -37,17 +131,23 @@ async def lifespan_db(
     """
     Контекст жизненного цикла БД:
     - создаёт engine,
-    - создаёт таблицы,
+    - создаёт таблицы (если settings.db_auto_create),
+    - прогревает пул соединений (для PostgreSQL — на весь pool_size),
     - отдаёт фабрику сессий,
     - закрывает engine по завершении.
     """
     engine = make_engine(settings)
     session_factory = make_session_factory(engine)
 
-    from .models import Base as _Base  # импорт отложенно, чтобы не образовать циклы
+    if settings.db_auto_create:
+        from .models import Base as _Base  # импорт отложенно, чтобы не образовать циклы
+
+        async with engine.begin() as conn:
+            await conn.run_sync(_Base.metadata.create_all)
 
-    async with engine.begin() as conn:
-        await conn.run_sync(_Base.metadata.create_all)
+    # SQLite-соединения локальные и дешёвые: хватает одного (заодно PRAGMA)
+    pg = engine.dialect.name == "postgresql"
+    await _warm_up_pool(engine, settings.db_pool_size if pg else 1)
 
     try:
         yield session_factory
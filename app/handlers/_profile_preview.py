@@ -1,57 +1,90 @@
 """
-Helper function for sending profile preview with photos.
+Helpers for rendering and sending profile preview with photos.
 """
 
+import asyncio
+from dataclasses import dataclass
+from functools import lru_cache
+
 from aiogram.types import InputMediaPhoto
 
 
+@lru_cache(maxsize=1024)
+def _media(file_id: str) -> InputMediaPhoto:
+    """Album item for a file_id; built (and validated) once per file_id.
+
+    ``InputMediaPhoto.model_construct`` is not used on purpose: aiogram's
+    ``Default(...)`` fields make it several times slower than the validating
+    constructor, and the cache already skips validation on repeat previews.
+    """
+    return InputMediaPhoto(media=file_id)
+
+
+@dataclass(slots=True)
+class ProfileView:
+    """Profile fields extracted from the user row once per preview."""
+
+    name: str | None
+    age: int | None
+    bio: str | None
+    interests: list[str]
+    photos: list[dict]
+
+    @classmethod
+    def from_user(cls, user) -> "ProfileView":
+        return cls(
+            name=user.name,
+            age=user.age,
+            bio=user.bio,
+            interests=(user.interests_json or {}).get("interests", []),
+            photos=(user.photos_json or {}).get("photos", []),
+        )
+
+    def text(self) -> str:
+        """Preview text; empty fields are skipped."""
+        rows = (
+            "📇 Предпросмотр анкеты:",
+            f"• Имя: {self.name}" if self.name else "",
+            f"• Возраст: {self.age}" if self.age else "",
+            f"• О себе: {self.bio}" if self.bio else "",
+            "• Интересы: " + ", ".join(self.interests) if self.interests else "",
+            f"• Фото: {len(self.photos)} шт." if self.photos else "",
+        )
+        return "\n".join(row for row in rows if row)
+
+
 async def _send_profile_preview_with_photos(
-    bot, chat_id: int, user, state, reply_markup
+    bot, chat_id: int, user, reply_markup, data: dict, fsm: dict
 ) -> None:
     """Send profile preview with user photos.
 
     Behavior:
-    - If user has photos: first send them as media_group (album), then send text preview with buttons
+    - If user has photos: send them as media_group (album) concurrently with the text preview with buttons
     - If no photos: just send text preview with buttons
+
+    The rendered text is cached in FSM data under ``preview``; handlers that
+    change profile fields reset it to None. ``data`` is the FSM data already
+    read by the handler; FSM writes (``last_kb_mid``, ``preview``) go into the
+    handler's ``fsm`` buffer, which the handler saves in one ``update_data``.
     """
-    # build preview text
-    lines = ["📇 Предпросмотр анкеты:"]
-    if user.name:
-        lines.append(f"• Имя: {user.name}")
-    if user.age:
-        lines.append(f"• Возраст: {user.age}")
-    if user.bio:
-        lines.append(f"• О себе: {user.bio}")
-    interests = (user.interests_json or {}).get("interests", [])
-    if interests:
-        lines.append("• Интересы: " + ", ".join(interests))
-    photos = (user.photos_json or {}).get("photos", [])
-    if photos:
-        lines.append(f"• Фото: {len(photos)} шт.")
-    preview = "\n".join(lines)
-
-    # get photo file_ids
-    file_ids = [p.get("file_id") for p in photos if p.get("file_id")]
+    view = ProfileView.from_user(user)
+    cached = fsm["preview"] if "preview" in fsm else data.get("preview")
+    preview = cached or view.text()
+
+    # album items (max 10 per media_group) in a single pass
+    media = [_media(fid) for fid in (p.get("file_id") for p in view.photos[:10]) if fid]
 
     # no photos -> simple text message
-    if not file_ids:
+    if not media:
         sent = await bot.send_message(chat_id, preview, reply_markup=reply_markup)
-        await state.update_data(last_kb_mid=sent.message_id)
+        fsm.update(last_kb_mid=sent.message_id, preview=preview)
         return
 
-    # has photos -> first send them as media_group (album), then send preview text with buttons
-    media = []
-    for fid in file_ids[:10]:
-        media.append(InputMediaPhoto(media=fid))
-
+    # has photos -> album and preview text are independent requests, send them concurrently
+    album = asyncio.create_task(bot.send_media_group(chat_id=chat_id, media=media))
     try:
-        # send photos as album first
-        await bot.send_media_group(chat_id=chat_id, media=media)
-    except Exception:
-        # ignore photo sending errors, still try to send preview text
-        pass
-
-    # then send text preview with buttons as a separate message
-    sent = await bot.send_message(chat_id, preview, reply_markup=reply_markup)
-    await state.update_data(last_kb_mid=sent.message_id)
-    return
+        sent = await bot.send_message(chat_id, preview, reply_markup=reply_markup)
+    finally:
+        # photo sending errors are ignored, preview errors are not
+        await asyncio.gather(album, return_exceptions=True)
+    fsm.update(last_kb_mid=sent.message_id, preview=preview)
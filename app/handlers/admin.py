@@ -2,26 +2,42 @@
 """
 Админ-панель только по /admin (ТЗ 8.*), доступ:
 - если есть роль 'admin' (roles/user_roles) ИЛИ id в ADMIN_IDS, и при этом status != blocked.
-Синхронизация ролей с .env.
+Синхронизация ролей с .env — один раз при старте бота (sync_admin_roles).
+Результат проверки прав кэшируется в памяти процесса на _ADMIN_CACHE_TTL секунд.
 Логирование всех действий в admin_log.
 """
 
 from __future__ import annotations
 
-from datetime import datetime, timezone
+import asyncio
+import time
 
 from aiogram import Router
 from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
 from aiogram.types import Message, CallbackQuery
 
-from sqlalchemy import select
+from sqlalchemy import and_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from ..config import Settings
 from ..models import User, Role, UserRole, AdminLog
+from ..states import AuthStates
+from ..utils.background import spawn
+from ..utils.activity import touch
 
 router = Router()
 
+# tg_id -> (time.monotonic() на момент проверки, есть ли права)
+_ADMIN_CACHE: dict[int, tuple[float, bool]] = {}
+_ADMIN_CACHE_TTL = 60.0
+
+# не больше 32 одновременных уведомлений пользователям из фоновых задач
+_NOTIFY_SEM = asyncio.Semaphore(32)
+
 
 async def _get_user(session: AsyncSession, tg_id: int) -> User | None:
     return (
@@ -29,44 +45,128 @@ async def _get_user(session: AsyncSession, tg_id: int) -> User | None:
     ).scalar_one_or_none()
 
 
-async def _is_admin(session: AsyncSession, settings: Settings, tg_id: int) -> bool:
-    user = await _get_user(session, tg_id)
-    # Если пользователя нет, но tg_id в ADMIN_IDS — создадим пользователя и продолжим синхронизацию ролей (п.8.3)
-    if not user:
-        if tg_id in settings.admin_ids:
-            user = User(telegram_id=tg_id, username=None, status="new", stage="new")
-            session.add(user)
-            await session.flush()
-        else:
-            return False
-
-    if tg_id in settings.admin_ids:
-        # синхронизируем роль
-        role = (
-            await session.execute(select(Role).where(Role.name == "admin"))
-        ).scalar_one_or_none()
-        if not role:
-            role = Role(name="admin")
-            session.add(role)
-            await session.flush()
-        link = (
-            await session.execute(
-                select(UserRole).where(
-                    UserRole.user_id == user.id, UserRole.role_id == role.id
+async def _insert_ignore(session: AsyncSession, model, **values) -> None:
+    """INSERT ... ON CONFLICT DO NOTHING (SQLite/PostgreSQL): без гонки read-then-write."""
+    insert = (
+        pg_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert
+    )
+    await session.execute(insert(model).values(**values).on_conflict_do_nothing())
+
+
+async def sync_admin_roles(
+    session_factory: async_sessionmaker[AsyncSession], settings: Settings
+) -> None:
+    """
+    Синхронизирует роль 'admin' с ADMIN_IDS (п.8.3): создаёт недостающих
+    пользователей, саму роль и связи user_roles. Вызывается один раз при старте.
+    """
+    if not settings.admin_ids:
+        return
+    role_id: int | None = None
+    async with session_factory() as session:
+        for tg_id in settings.admin_ids:
+            # пользователь, роль и связь — одним запросом; пишем только недостающее
+            q = (
+                select(User.id, Role.id, UserRole.user_id)
+                .select_from(User)
+                .outerjoin(Role, Role.name == "admin")
+                .outerjoin(
+                    UserRole,
+                    and_(UserRole.user_id == User.id, UserRole.role_id == Role.id),
                 )
+                .where(User.telegram_id == tg_id)
             )
-        ).scalar_one_or_none()
-        if not link:
-            session.add(UserRole(user_id=user.id, role_id=role.id))
-            await session.flush()
+            row = (await session.execute(q)).first()
+            user_id, found_role_id, link_user_id = row or (None, None, None)
+            role_id = role_id or found_role_id
+
+            if user_id is None:
+                user = User(telegram_id=tg_id, username=None, status="new", stage="new")
+                session.add(user)
+                await session.flush()
+                user_id = user.id
+            if role_id is None:
+                await _insert_ignore(session, Role, name="admin")
+                role_id = (
+                    await session.execute(select(Role.id).where(Role.name == "admin"))
+                ).scalar_one()
+            if link_user_id is None:
+                await _insert_ignore(
+                    session, UserRole, user_id=user_id, role_id=role_id
+                )
+        await session.commit()
+    _ADMIN_CACHE.clear()
+
 
-    # проверяем по ролям
+async def _notify(bot, chat_id: int, text: str) -> None:
+    """Отправляет пользователю решение админа; ошибки доставки игнорируем."""
+    async with _NOTIFY_SEM:
+        try:
+            await bot.send_message(chat_id, text)
+        except Exception:
+            pass
+
+
+def _forget_admin(tg_id: int) -> None:
+    """Сбрасывает закэшированное решение о правах пользователя."""
+    _ADMIN_CACHE.pop(tg_id, None)
+
+
+async def _is_admin(session: AsyncSession, tg_id: int) -> bool:
+    now = time.monotonic()
+    cached = _ADMIN_CACHE.get(tg_id)
+    if cached and now - cached[0] < _ADMIN_CACHE_TTL:
+        return cached[1]
+
+    # роль 'admin' у незаблокированного пользователя — одним запросом
     q = (
-        select(Role)
-        .join(UserRole, UserRole.role_id == Role.id)
-        .where(UserRole.user_id == user.id, Role.name == "admin")
+        select(User.id)
+        .join(UserRole, UserRole.user_id == User.id)
+        .join(Role, Role.id == UserRole.role_id)
+        .where(
+            User.telegram_id == tg_id,
+            User.status != "blocked",
+            Role.name == "admin",
+        )
+        .limit(1)
     )
-    return (await session.execute(q)).scalar_one_or_none() is not None
+    is_admin = (await session.execute(q)).first() is not None
+    _ADMIN_CACHE[tg_id] = (now, is_admin)
+    return is_admin
+
+
+async def _open_admin_step(session: AsyncSession, tg_user, settings: Settings) -> str:
+    """Проверка прав и запись open_admin; возвращает текст ответа."""
+    user = await _get_user(session, tg_user.id)
+    if not user:
+        # создаём, если tg_id ∈ ADMIN_IDS (ТЗ 8.3)
+        if tg_user.id not in settings.admin_ids:
+            return "⛔️ Нет прав."
+        user = User(
+            telegram_id=tg_user.id,
+            username=tg_user.username,
+            status="new",
+            stage="new",
+        )
+        session.add(user)
+        await session.flush()
+
+    if user.status == "blocked":
+        return "⛔️ Нет прав (пользователь заблокирован)."
+
+    if not await _is_admin(session, tg_user.id):
+        return "⛔️ Нет прав."
+
+    touch(user.telegram_id)
+    session.add(
+        AdminLog(
+            admin_telegram_id=tg_user.id,
+            action="open_admin",
+            payload={"user_id": user.id},
+        )
+    )
+    await session.commit()
+    return "Админ-панель открыта.\nДействия по заявкам будут приходить в админ-чат при блокировках."
 
 
 @router.message(Command("admin"))
@@ -76,43 +176,41 @@ async def cmd_admin(
     settings: Settings,
 ) -> None:
     async with session_factory() as session:
-        user = await _get_user(session, message.from_user.id)
-        if not user:
-            # создаём, если tg_id ∈ ADMIN_IDS (ТЗ 8.3)
-            if message.from_user.id in settings.admin_ids:
-                user = User(
-                    telegram_id=message.from_user.id,
-                    username=message.from_user.username,
-                    status="new",
-                    stage="new",
-                )
-                session.add(user)
-                await session.flush()
-            else:
-                await message.answer("⛔️ Нет прав.")
-                return
-
-        if user.status == "blocked":
-            await message.answer("⛔️ Нет прав (пользователь заблокирован).")
-            return
-
-        if not await _is_admin(session, settings, message.from_user.id):
-            await message.answer("⛔️ Нет прав.")
-            return
-
-        user.last_activity = datetime.now(timezone.utc)
-        session.add(
-            AdminLog(
-                admin_telegram_id=message.from_user.id,
-                action="open_admin",
-                payload={"user_id": user.id},
-            )
-        )
-        await session.commit()
+        reply = await _open_admin_step(session, message.from_user, settings)
+    # отвечаем после закрытия сессии: соединение пула не ждёт ответа Telegram
+    await message.answer(reply)
+
 
-        await message.answer(
-            "Админ-панель открыта.\nДействия по заявкам будут приходить в админ-чат при блокировках."
+async def _decision_step(
+    session: AsyncSession, admin_tg_id: int, action: str, target_id: int
+) -> tuple[User | None, str | None]:
+    """Применяет решение админа; возвращает (пользователь, текст отказа)."""
+    if not await _is_admin(session, admin_tg_id):
+        return None, "Нет прав"
+
+    user = (
+        await session.execute(select(User).where(User.id == target_id))
+    ).scalar_one_or_none()
+    if not user:
+        return None, "Пользователь не найден"
+
+    if action == "block":
+        user.status = "blocked"
+    else:
+        # Разблокировать: status=new, stage=verifying_email, counters reset
+        user.status = "new"
+        user.stage = "verifying_email"
+        user.email_attempts = 0
+        user.otp_attempts = 0
+    _forget_admin(user.telegram_id)
+    session.add(
+        AdminLog(
+            admin_telegram_id=admin_tg_id,
+            action=action,
+            payload={"user_id": user.id},
         )
+    )
+    return user, None
 
 
 @router.callback_query()
@@ -120,87 +218,56 @@ async def admin_callbacks(
     cq: CallbackQuery,
     session_factory: async_sessionmaker[AsyncSession],
     settings: Settings,
+    fsm_storage: BaseStorage,
 ) -> None:
     data = cq.data or ""
     if not (data.startswith("admin:block:") or data.startswith("admin:unblock:")):
         return
 
-    async with session_factory() as session:
-        if not await _is_admin(session, settings, cq.from_user.id):
-            await cq.answer("Нет прав")
-            return
-
-        _, action, user_id_str = data.split(":")
-        target_id = int(user_id_str)
-        user = (
-            await session.execute(select(User).where(User.id == target_id))
-        ).scalar_one_or_none()
-        if not user:
-            await cq.answer("Пользователь не найден")
-            return
-
-        reviewed_by = cq.from_user.username or str(cq.from_user.id)
-        if action == "block":
-            user.status = "blocked"
-            session.add(
-                AdminLog(
-                    admin_telegram_id=cq.from_user.id,
-                    action="block",
-                    payload={"user_id": user.id},
-                )
-            )
-            await session.commit()
-            # Отредактируем исходное сообщение заявки: отметим решение и уберём кнопки
-            try:
-                await cq.message.edit_text(
-                    cq.message.text
-                    + f"\n\nРешение: Пользователь {'@' + user.username} заблокирован.\n👨‍💻Рассмотрел: {'@' + reviewed_by}"
-                )
-            except Exception:
-                pass
-            # Попробуем уведомить пользователя
-            if user.telegram_id:
-                try:
-                    await cq.message.bot.send_message(
-                        user.telegram_id,
-                        "Решение по временной блокировке: Вам закрыт доступ. Если считаете это ошибкой - обратитесь к администратору.",
-                    )
-                except Exception:
-                    pass
-        else:
-            # Разблокировать: status=new, stage=verifying_email, counters reset
-            user.status = "new"
-            user.stage = "verifying_email"
-            user.email_attempts = 0
-            user.otp_attempts = 0
-            session.add(
-                AdminLog(
-                    admin_telegram_id=cq.from_user.id,
-                    action="unblock",
-                    payload={"user_id": user.id},
-                )
-            )
-            await session.commit()
-            # Редактируем исходное сообщение заявки
-            try:
-                await cq.message.edit_text(
-                    cq.message.text
-                    + f"\n\nРешение: Пользователь {'@' + user.username} разблокирован и возвращён к вводу корпоративного e‑mail.\n👨‍💻Рассмотрел: {'@' + reviewed_by}"
-                )
-            except Exception:
-                pass
-            # Уведомляем пользователя
-            if user.telegram_id:
-                try:
-                    await cq.message.bot.send_message(
-                        user.telegram_id,
-                        "Решение по временной блокировке: Вас разблокировали. Пожалуйста, пройдите регистрацию заново и введите корпоративный e‑mail:",
-                    )
-                except Exception:
-                    pass
-        # Убираем inline-кнопки у исходного сообщения, если они остались
+    _, action, user_id_str = data.split(":")
+    # Изменение статуса и запись в admin_log — одна транзакция (commit на выходе);
+    # запросы к Telegram — уже после неё, соединение пула к тому времени свободно
+    async with session_factory.begin() as session:
+        user, denial = await _decision_step(
+            session, cq.from_user.id, action, int(user_id_str)
+        )
+    if denial:
+        await cq.answer(denial)
+        return
+
+    reviewed_by = cq.from_user.username or str(cq.from_user.id)
+    if action == "block":
+        decision = "заблокирован."
+        notice = "Решение по временной блокировке: Вам закрыт доступ. Если считаете это ошибкой - обратитесь к администратору."
+    else:
+        decision = "разблокирован и возвращён к вводу корпоративного e‑mail."
+        notice = "Решение по временной блокировке: Вас разблокировали. Пожалуйста, пройдите регистрацию заново и введите корпоративный e‑mail:"
+
+    # Разблокированный снова вводит e-mail: его состояние FSM должно пропустить
+    # текст в регистрацию (фильтр AuthStates в registration.py)
+    if action != "block" and user.telegram_id:
+        await FSMContext(
+            storage=fsm_storage,
+            key=StorageKey(
+                bot_id=cq.bot.id, chat_id=user.telegram_id, user_id=user.telegram_id
+            ),
+        ).set_state(AuthStates.verifying_email)
+
+    # Уведомляем пользователя в фоне, чтобы не держать обработку колбэка
+    if user.telegram_id:
+        spawn(_notify(cq.message.bot, user.telegram_id, notice))
+
+    # Одним запросом отмечаем решение в заявке и убираем inline-кнопки
+    try:
+        await cq.message.edit_text(
+            cq.message.text
+            + f"\n\nРешение: Пользователь {'@' + user.username} {decision}\n👨‍💻Рассмотрел: {'@' + reviewed_by}",
+            reply_markup=None,
+        )
+    except Exception:
+        # текст отредактировать не удалось — хотя бы уберём кнопки
         try:
             await cq.message.edit_reply_markup(reply_markup=None)
         except Exception:
             pass
-        await cq.answer()
+    await cq.answer()
@@ -2,20 +2,28 @@
 """
 Анкета: name → photo → bio → age → interests → review → filled.
 Гасим кнопки после действия пользователя. Стадии анкеты имеют приоритет над регистрацией.
+Соответствие telegram_id → users.id кэшируется в памяти процесса на _PK_CACHE_TTL секунд.
+Фото из альбома (media_group_id) копятся _ALBUM_DELAY секунд и сохраняются одним разом.
+Стадия анкеты дублируется в состояние FSM (ProfileStates), чтобы текст и фото вне
+анкеты отсеивались фильтром без похода в БД; источником истины остаётся users.stage.
 """
 
 from __future__ import annotations
 
-from datetime import datetime, timezone
+import asyncio
+import time
+from contextlib import asynccontextmanager
 
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
-from aiogram.types import InputMediaPhoto
 from aiogram.fsm.context import FSMContext
 from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.filters import StateFilter
 
-from sqlalchemy import select
+import orjson
+from sqlalchemy import bindparam, insert, select, text, update
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import load_only, undefer_group
 
 from ..config import Settings
 from ..keyboards import (
@@ -24,105 +32,232 @@ from ..keyboards import (
     kb_prefilled_data,
     kb_profile_review,
 )
-from ..models import User
+from ..models import PROFILE_BLOB, User
+from ..states import ProfileStates, profile_state
+from ..utils.activity import touch
+from ..utils.background import spawn
+from ..utils.kb import drop_kb, drop_kb_by_id
 from ..utils.security import contains_banned_words, normalize_interests
+from ._profile_preview import ProfileView, _send_profile_preview_with_photos
 
 router = Router()
 
+# telegram_id -> (момент записи, users.id); PK не меняется, поэтому при записи не сбрасываем
+_PK_CACHE: dict[int, tuple[float, int]] = {}
+_PK_CACHE_TTL = 600.0
+_PK_CACHE_MAX = 50_000
+
+# Дописывание фото в photos_json на стороне БД (не больше 3): без чтения колонки
+# в Python и без потери параллельных добавлений. Возвращает новое число фото.
+_APPEND_PHOTOS_PG = text(
+    """
+    UPDATE users SET photos_json = jsonb_build_object('photos', (
+        SELECT coalesce(jsonb_agg(t.e ORDER BY t.i), '[]'::jsonb)
+        FROM jsonb_array_elements(
+            coalesce(photos_json::jsonb -> 'photos', '[]'::jsonb) || CAST(:new AS jsonb)
+        ) WITH ORDINALITY AS t(e, i)
+        WHERE t.i <= 3
+    ))
+    WHERE id = :pk
+      AND coalesce(jsonb_array_length(photos_json::jsonb -> 'photos'), 0) < 3
+    RETURNING jsonb_array_length(photos_json::jsonb -> 'photos')
+    """
+)
+_APPEND_PHOTOS_SQLITE = text(
+    """
+    UPDATE users SET photos_json = json_object('photos', (
+        SELECT json_group_array(json(value)) FROM (
+            SELECT 0 AS src, key, value
+            FROM json_each(coalesce(json_extract(photos_json, '$.photos'), '[]'))
+            UNION ALL
+            SELECT 1, key, value FROM json_each(:new)
+            ORDER BY src, key
+            LIMIT 3
+        )
+    ))
+    WHERE id = :pk
+      AND coalesce(json_array_length(photos_json, '$.photos'), 0) < 3
+    RETURNING json_array_length(photos_json, '$.photos')
+    """
+)
+
+# (chat_id, media_group_id) -> {"file_ids": [...], "timer": TimerHandle}
+_ALBUMS: dict[tuple[int, str], dict] = {}
+_ALBUM_DELAY = 0.4
+
+# создание пользователя (как в /start): один скомпилированный INSERT … RETURNING на процесс
+_INSERT_USER = (
+    insert(User)
+    .values(
+        telegram_id=bindparam("tg_id"),
+        username=None,
+        status="new",
+        stage="new",
+        origin="self",
+    )
+    .returning(User)
+    .options(undefer_group(PROFILE_BLOB))
+)
+
+# служебные колонки: стадия/статус без JSON-полей анкеты и импорта
+_LIGHT = (
+    load_only(User.id, User.telegram_id, User.status, User.stage, User.last_activity),
+)
+# все поля, включая отложенные JSON-колонки анкеты (предпросмотр, импорт)
+_FULL = (undefer_group(PROFILE_BLOB),)
+
 
 # --------------------------- helpers ---------------------------- #
 
 
-async def _user(session: AsyncSession, tg_id: int) -> User:
-    res = await session.execute(select(User).where(User.telegram_id == tg_id))
+async def _user(
+    session: AsyncSession,
+    tg_id: int,
+    *,
+    light: bool = False,
+    data: dict | None = None,
+    fsm: dict | None = None,
+) -> User:
+    """
+    Пользователь по telegram_id (создаётся, если его нет).
+    light=True — грузим только служебные колонки (_LIGHT); остальные поля
+    можно присваивать, но не читать. Иначе — все поля вместе с JSON-колонками (_FULL).
+    data — уже прочитанные данные FSM: PK берётся ещё и из user_pk, если его нет
+    в кэше процесса (например, после перезапуска с постоянным хранилищем FSM).
+    fsm — накопитель записей в FSM (см. _save_fsm); сюда кладём найденный user_pk.
+    """
+    options = _LIGHT if light else _FULL
+    now = time.monotonic()
+    cached = _PK_CACHE.get(tg_id)
+    pk = cached[1] if cached and now - cached[0] < _PK_CACHE_TTL else None
+    if pk is None and data is not None:
+        pk = data.get("user_pk")
+    if pk is not None:
+        # по PK: identity map сессии или поиск по первичному ключу
+        user = await session.get(User, pk, options=options)
+        if user is not None and user.telegram_id == tg_id:
+            _remember_pk(tg_id, pk, now)
+            return user
+        _PK_CACHE.pop(tg_id, None)
+
+    res = await session.execute(
+        select(User).options(*options).where(User.telegram_id == tg_id)
+    )
     user = res.scalar_one_or_none()
     if user:
+        _remember_pk(tg_id, user.id, now)
+        if fsm is not None:
+            fsm["user_pk"] = user.id
         return user
     # Если пользователя нет — создаём (аналогично /start)
-    user = User(
-        telegram_id=tg_id, username=None, status="new", stage="new", origin="self"
-    )
-    session.add(user)
-    await session.flush()
+    user = (await session.execute(_INSERT_USER, {"tg_id": tg_id})).scalar_one()
+    _remember_pk(tg_id, user.id, now)
+    if fsm is not None:
+        fsm["user_pk"] = user.id
     return user
 
 
-def _photos_count(user: User) -> int:
-    return len((user.photos_json or {}).get("photos", []))
+async def _set_stage(
+    session: AsyncSession,
+    tg_id: int,
+    stage: str,
+    *,
+    from_stage: str | None = None,
+    state: FSMContext | None = None,
+    full: bool = False,
+    **extra,
+) -> User | None:
+    """
+    Переводит пользователя на стадию одним UPDATE … RETURNING (без предварительного SELECT).
+    from_stage — переход выполняется, только если пользователь сейчас на этой стадии;
+    None — если переход не выполнен (не та стадия).
+    state — вместе со стадией выставляется и состояние FSM.
+    full — вернуть и JSON-колонки анкеты (нужны для предпросмотра).
+    """
+    stmt = (
+        update(User)
+        .where(User.telegram_id == tg_id)
+        .values(stage=stage, **extra)
+        .returning(User)
+    )
+    if full:
+        stmt = stmt.options(*_FULL)
+    if from_stage is not None:
+        stmt = stmt.where(User.stage == from_stage)
+    user = (await session.execute(stmt)).scalar_one_or_none()
+    if user is not None:
+        touch(tg_id)
+        if state is not None:
+            await state.set_state(profile_state(stage))
+    if user is not None or from_stage is not None:
+        return user
 
+    # пользователя ещё нет — создаём его обычным путём
+    user = await _user(session, tg_id, light=not full)
+    user.stage = stage
+    touch(tg_id)
+    if state is not None:
+        await state.set_state(profile_state(stage))
+    for key, value in extra.items():
+        setattr(user, key, value)
+    return user
 
-def _append_photo(user: User, file_id: str) -> None:
-    photos = (user.photos_json or {}).get("photos", [])
-    if len(photos) >= 3:
-        return
-    photos.append({"file_id": file_id, "ts": datetime.now(timezone.utc).isoformat()})
-    user.photos_json = {"photos": photos}
 
+def _remember_pk(tg_id: int, pk: int, now: float) -> None:
+    if len(_PK_CACHE) >= _PK_CACHE_MAX:
+        _PK_CACHE.clear()
+    _PK_CACHE[tg_id] = (now, pk)
 
-def _preview_text(user: User) -> str:
-    lines = ["📇 Предпросмотр анкеты:"]
-    if user.name:
-        lines.append(f"• Имя: {user.name}")
-    if user.age:
-        lines.append(f"• Возраст: {user.age}")
-    if user.bio:
-        lines.append(f"• О себе: {user.bio}")
-    interests = (user.interests_json or {}).get("interests", [])
-    if interests:
-        lines.append("• Интересы: " + ", ".join(interests))
-    if _photos_count(user):
-        lines.append(f"• Фото: {_photos_count(user)} шт.")
-    return "\n".join(lines)
-
-
-async def _send_profile_preview_with_photos(
-    bot, chat_id: int, user: User, state: FSMContext, reply_markup
-) -> None:
-    """Send profile preview with user photos.
 
-    Behavior:
-    - If user has photos: first send them as media_group (album), then send text preview with buttons
-    - If no photos: just send text preview with buttons
+async def _append_photos(session: AsyncSession, user: User, file_ids: list[str]) -> int:
     """
-    preview = _preview_text(user)
-    photos = (user.photos_json or {}).get("photos", [])
-    file_ids = [p.get("file_id") for p in photos if p.get("file_id")]
-
-    # no photos -> simple text message
-    if not file_ids:
-        sent = await bot.send_message(chat_id, preview, reply_markup=reply_markup)
-        await state.update_data(last_kb_mid=sent.message_id)
-        return
+    Дописывает фото одним UPDATE на стороне БД; возвращает число фото после записи.
+    Загруженный user.photos_json после вызова устаревает — его не читаем.
+    """
+    ts = int(time.time())  # epoch-секунды
+    new = orjson.dumps([{"file_id": fid, "ts": ts} for fid in file_ids]).decode()
+    stmt = (
+        _APPEND_PHOTOS_PG
+        if session.get_bind().dialect.name == "postgresql"
+        else _APPEND_PHOTOS_SQLITE
+    )
+    count = (await session.execute(stmt, {"pk": user.id, "new": new})).scalar()
+    # строка не обновилась — фото уже 3
+    return 3 if count is None else count
 
-    # has photos -> first send them as media_group (album), then send text preview with buttons
-    media = []
-    for fid in file_ids[:10]:
-        media.append(InputMediaPhoto(media=fid))
 
+@asynccontextmanager
+async def _commit_alongside(session: AsyncSession):
+    """
+    Коммит идёт параллельно с телом блока (ответом в Telegram), на выходе его дожидаемся.
+    Внутри блока сессию не трогаем — она занята коммитом.
+    """
+    commit = asyncio.create_task(session.commit())
     try:
-        # send photos as media group (album)
-        await bot.send_media_group(chat_id=chat_id, media=media)
-    except Exception:
-        # ignore photo sending errors, still try to send preview text
-        pass
+        yield
+    finally:
+        await commit
 
-    # then send preview text with buttons as a separate message
-    sent = await bot.send_message(chat_id, preview, reply_markup=reply_markup)
-    await state.update_data(last_kb_mid=sent.message_id)
-    return
 
+def _preview_text(user: User) -> str:
+    return ProfileView.from_user(user).text()
 
-async def _clear_last_kb(state: FSMContext, chat_id: int, bot) -> None:
-    data = await state.get_data()
+
+def _clear_last_kb(data: dict, fsm: dict, chat_id: int, bot) -> None:
+    # сам запрос к Telegram не ждём — он идёт параллельно с работой хендлера
     mid = data.get("last_kb_mid")
     if mid:
-        try:
-            await bot.edit_message_reply_markup(
-                chat_id=chat_id, message_id=mid, reply_markup=None
-            )
-        except Exception:
-            pass
-        await state.update_data(last_kb_mid=None)
+        spawn(drop_kb_by_id(bot, chat_id, mid))
+        fsm["last_kb_mid"] = None
+
+
+async def _save_fsm(state: FSMContext, fsm: dict) -> None:
+    """
+    Записи хендлера в FSM (last_kb_mid, preview, user_pk) копятся в словаре fsm
+    и уходят в хранилище одним update_data в конце.
+    """
+    if fsm:
+        await state.update_data(**fsm)
 
 
 # --------------------------- entry point ------------------------ #
@@ -135,21 +270,22 @@ async def cb_prof_start(
     session_factory: async_sessionmaker[AsyncSession],
     settings: Settings,
 ) -> None:
+    bot, chat_id = cq.bot, cq.message.chat.id
     # снимаем кнопки у нажатого сообщения
-    try:
-        await cq.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
+    spawn(drop_kb(cq.message))
 
+    data = await state.get_data()
+    fsm: dict = {}
     async with session_factory() as session:
-        user = await _user(session, cq.from_user.id)
-        user.last_activity = datetime.now(timezone.utc)
+        user = await _user(session, cq.from_user.id, data=data, fsm=fsm)
+        touch(user.telegram_id)
 
         if user.status == "blocked":
             await session.commit()
-            await cq.message.answer(
-                "Доступ временно заблокирован. Свяжитесь с администратором."
+            await bot.send_message(
+                chat_id, "Доступ временно заблокирован. Свяжитесь с администратором."
             )
+            await _save_fsm(state, fsm)
             await cq.answer()
             return
 
@@ -167,63 +303,75 @@ async def cb_prof_start(
         if user.stage not in profile_steps:
             # start from name for new users
             user.stage = "profile_name"
+            await state.set_state(ProfileStates.profile_name)
 
             # Предзаполнение имени из import_payload
             prefilled = None
             if user.origin == "import" and user.import_payload:
                 prefilled = user.import_payload.get("profile_name")
                 if prefilled and 2 <= len(prefilled) <= 100:
-                    banned, _ = contains_banned_words(prefilled, settings.banned_words)
+                    banned, _ = contains_banned_words(
+                        prefilled, settings.banned_words_set
+                    )
                     if not banned:
                         await session.commit()
-                        sent = await cq.message.answer(
+                        sent = await bot.send_message(
+                            chat_id,
                             f"У нас есть ваше имя из импорта: {prefilled}\nОставить или ввести новое?",
                             reply_markup=kb_prefilled_data(),
                         )
-                        await state.update_data(last_kb_mid=sent.message_id)
+                        fsm["last_kb_mid"] = sent.message_id
+                        await _save_fsm(state, fsm)
                         await cq.answer()
                         return
 
             await session.commit()
-            await cq.message.answer("Давайте заполним акнету! Как вас зовут?")
-            await state.update_data(last_kb_mid=None)
+            await bot.send_message(chat_id, "Давайте заполним акнету! Как вас зовут?")
+            fsm["last_kb_mid"] = None
+            await _save_fsm(state, fsm)
             await cq.answer()
             return
 
         # If we're here, user.stage is in profile_steps — resume where they left off.
         await session.commit()
+        await state.set_state(profile_state(user.stage))
 
         if user.stage == "profile_name":
-            await cq.message.answer("Давайте заполним акнету! Как вас зовут?")
-            await state.update_data(last_kb_mid=None)
+            await bot.send_message(chat_id, "Давайте заполним акнету! Как вас зовут?")
+            fsm["last_kb_mid"] = None
         elif user.stage == "profile_photo":
-            sent = await cq.message.answer(
+            sent = await bot.send_message(
+                chat_id,
                 "Отправьте до 3 фото (можно альбомом) или воспользуйтесь кнопкой:",
                 reply_markup=kb_profile_photo(),
             )
-            await state.update_data(last_kb_mid=sent.message_id)
+            fsm["last_kb_mid"] = sent.message_id
         elif user.stage == "profile_bio":
-            await cq.message.answer("Расскажите о себе (до 500 символов):")
-            await state.update_data(last_kb_mid=None)
+            await bot.send_message(chat_id, "Расскажите о себе (до 500 символов):")
+            fsm["last_kb_mid"] = None
         elif user.stage == "profile_age":
-            await cq.message.answer("Введите ваш возраст (18–50):")
-            await state.update_data(last_kb_mid=None)
+            await bot.send_message(chat_id, "Введите ваш возраст (18–50):")
+            fsm["last_kb_mid"] = None
         elif user.stage == "profile_interests":
-            await cq.message.answer(
-                "Перечислите интересы через запятую (например: Python, музыка, дизайн)."
+            await bot.send_message(
+                chat_id,
+                "Перечислите интересы через запятую (например: Python, музыка, дизайн).",
             )
-            await state.update_data(last_kb_mid=None)
+            fsm["last_kb_mid"] = None
         elif user.stage == "profile_review":
             # send preview with attached photos (if any)
             await _send_profile_preview_with_photos(
-                cq.message.bot, cq.message.chat.id, user, state, kb_profile_review()
+                bot, chat_id, user, kb_profile_review(), data, fsm
             )
         elif user.stage == "profile_filled":
-            sent = await cq.message.answer(
-                _preview_text(user), reply_markup=kb_profile_filled()
+            # текст анкеты кэшируется в FSM до первого изменения полей
+            preview = data.get("preview") or _preview_text(user)
+            sent = await bot.send_message(
+                chat_id, preview, reply_markup=kb_profile_filled()
             )
-            await state.update_data(last_kb_mid=sent.message_id)
+            fsm.update(last_kb_mid=sent.message_id, preview=preview)
 
+        await _save_fsm(state, fsm)
         await cq.answer()
 
 
@@ -234,21 +382,25 @@ async def cb_prefilled_keep(
     session_factory: async_sessionmaker[AsyncSession],
     settings: Settings,
 ) -> None:
-    try:
-        await cq.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
+    bot, chat_id = cq.bot, cq.message.chat.id
+    spawn(drop_kb(cq.message))
     async with session_factory() as session:
-        user = await _user(session, cq.from_user.id)
+        fsm: dict = {}
+        user = await _user(
+            session, cq.from_user.id, data=await state.get_data(), fsm=fsm
+        )
         user.stage = "profile_photo"
         if user.import_payload and user.import_payload.get("profile_name"):
             user.name = user.import_payload["profile_name"]
         await session.commit()
-        sent = await cq.message.answer(
+        await state.set_state(ProfileStates.profile_photo)
+        sent = await bot.send_message(
+            chat_id,
             "Отправьте до 3 фото (можно альбомом) или воспользуйтесь кнопкой:",
             reply_markup=kb_profile_photo(),
         )
-        await state.update_data(last_kb_mid=sent.message_id)
+        fsm.update(last_kb_mid=sent.message_id, preview=None)
+        await _save_fsm(state, fsm)
         await cq.answer()
 
 
@@ -259,23 +411,29 @@ async def cb_prefilled_new(
     session_factory: async_sessionmaker[AsyncSession],
     settings: Settings,
 ) -> None:
-    try:
-        await cq.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
+    bot, chat_id = cq.bot, cq.message.chat.id
+    spawn(drop_kb(cq.message))
     async with session_factory() as session:
-        user = await _user(session, cq.from_user.id)
-        user.stage = "profile_name"
+        await _set_stage(session, cq.from_user.id, "profile_name", state=state)
         await session.commit()
-        await cq.message.answer("Давайте заполним анкету! Как вас зовут?")
-        await state.update_data(last_kb_mid=None)
+        await bot.send_message(chat_id, "Давайте заполним анкету! Как вас зовут?")
+        await _save_fsm(state, {"last_kb_mid": None})
         await cq.answer()
 
 
 # --------------------------- text steps ------------------------- #
 
 
-@router.message(F.text & ~F.text.startswith("/"))
+@router.message(
+    StateFilter(
+        None,
+        ProfileStates.profile_name,
+        ProfileStates.profile_bio,
+        ProfileStates.profile_age,
+        ProfileStates.profile_interests,
+    ),
+    F.text & ~F.text.startswith("/"),
+)
 async def on_profile_text(
     message: Message,
     state: FSMContext,
@@ -285,112 +443,136 @@ async def on_profile_text(
     """
     Текстовый обработчик только для стадий анкеты.
     """
-    async with session_factory() as session:
-        user = await _user(session, message.from_user.id)
-
-        # обрабатываем только свои стадии — если не наша стадия, отменяем обработчик
-        if user.stage not in {
-            "profile_name",
-            "profile_bio",
-            "profile_age",
-            "profile_interests",
-        }:
-            await session.commit()
-            raise SkipHandler()
+    data = await state.get_data()
+    fsm: dict = {}
+    try:
+        async with session_factory() as session:
+            user = await _user(
+                session, message.from_user.id, light=True, data=data, fsm=fsm
+            )
 
-        # гасим предыдущие кнопки
-        await _clear_last_kb(state, message.chat.id, message.bot)
+            # обрабатываем только свои стадии — если не наша стадия, отменяем обработчик
+            if user.stage not in {
+                "profile_name",
+                "profile_bio",
+                "profile_age",
+                "profile_interests",
+            }:
+                await session.commit()
+                raise SkipHandler()
 
-        user.last_activity = datetime.now(timezone.utc)
-        text = (message.text or "").strip()
+            # гасим предыдущие кнопки
+            _clear_last_kb(data, fsm, message.chat.id, message.bot)
 
-        if user.status == "blocked":
-            await session.commit()
-            await message.answer(
-                "Доступ временно заблокирован. Свяжитесь с администратором."
-            )
-            return
+            touch(user.telegram_id)
+            text = (message.text or "").strip()
 
-        # NAME
-        if user.stage == "profile_name":
-            if not (2 <= len(text) <= 100):
-                await message.answer(
-                    "⚠️ Имя должно быть от 2 до 100 символов. Попробуйте ещё раз."
-                )
+            if user.status == "blocked":
                 await session.commit()
-                return
-            bad, word = contains_banned_words(text, settings.banned_words)
-            if bad:
                 await message.answer(
-                    f"⚠️ Имя содержит запрещённое слово «{word}». Введите другое."
+                    "Доступ временно заблокирован. Свяжитесь с администратором."
                 )
-                await session.commit()
                 return
-            user.name = text
-            user.stage = "profile_photo"
-            await session.commit()
-            sent = await message.answer(
-                "Отправьте до 3 фото (можно альбомом) или нажмите:",
-                reply_markup=kb_profile_photo(),
-            )
-            await state.update_data(last_kb_mid=sent.message_id)
-            return
 
-        # BIO
-        if user.stage == "profile_bio":
-            if len(text) > 500:
-                await message.answer("⚠️ Описание должно быть не длиннее 500 символов.")
-                await session.commit()
-                return
-            bad, word = contains_banned_words(text, settings.banned_words)
-            if bad:
-                await message.answer(
-                    f"⚠️ Текст содержит запрещённое слово «{word}». Исправьте, пожалуйста."
-                )
-                await session.commit()
+            # NAME
+            if user.stage == "profile_name":
+                if not (2 <= len(text) <= 100):
+                    await message.answer(
+                        "⚠️ Имя должно быть от 2 до 100 символов. Попробуйте ещё раз."
+                    )
+                    await session.commit()
+                    return
+                bad, word = contains_banned_words(text, settings.banned_words_set)
+                if bad:
+                    await message.answer(
+                        f"⚠️ Имя содержит запрещённое слово «{word}». Введите другое."
+                    )
+                    await session.commit()
+                    return
+                user.name = text
+                user.stage = "profile_photo"
+                async with _commit_alongside(session):
+                    await state.set_state(ProfileStates.profile_photo)
+                    sent = await message.answer(
+                        "Отправьте до 3 фото (можно альбомом) или нажмите:",
+                        reply_markup=kb_profile_photo(),
+                    )
+                    fsm.update(last_kb_mid=sent.message_id, preview=None)
                 return
-            user.bio = text
-            user.stage = "profile_age"
-            await session.commit()
-            await message.answer("Введите ваш возраст (18–50):")
-            await state.update_data(last_kb_mid=None)
-            return
 
-        # AGE
-        if user.stage == "profile_age":
-            if not text.isdigit():
-                await message.answer("⚠️ Возраст должен быть числом от 18 до 50.")
-                await session.commit()
+            # BIO
+            if user.stage == "profile_bio":
+                if len(text) > 500:
+                    await message.answer(
+                        "⚠️ Описание должно быть не длиннее 500 символов."
+                    )
+                    await session.commit()
+                    return
+                bad, word = contains_banned_words(text, settings.banned_words_set)
+                if bad:
+                    await message.answer(
+                        f"⚠️ Текст содержит запрещённое слово «{word}». Исправьте, пожалуйста."
+                    )
+                    await session.commit()
+                    return
+                user.bio = text
+                user.stage = "profile_age"
+                async with _commit_alongside(session):
+                    await state.set_state(ProfileStates.profile_age)
+                    await message.answer("Введите ваш возраст (18–50):")
+                    fsm.update(last_kb_mid=None, preview=None)
                 return
-            age = int(text)
-            if not (18 <= age <= 50):
-                await message.answer("⚠️ Возраст должен быть числом от 18 до 50.")
-                await session.commit()
+
+            # AGE
+            if user.stage == "profile_age":
+                if not text.isdigit():
+                    await message.answer("⚠️ Возраст должен быть числом от 18 до 50.")
+                    await session.commit()
+                    return
+                age = int(text)
+                if not (18 <= age <= 50):
+                    await message.answer("⚠️ Возраст должен быть числом от 18 до 50.")
+                    await session.commit()
+                    return
+                user.age = age
+                user.stage = "profile_interests"
+                async with _commit_alongside(session):
+                    await state.set_state(ProfileStates.profile_interests)
+                    await message.answer(
+                        "Перечислите интересы через запятую (например: Python, музыка, дизайн)."
+                    )
+                    fsm.update(last_kb_mid=None, preview=None)
                 return
-            user.age = age
-            user.stage = "profile_interests"
-            await session.commit()
-            await message.answer(
-                "Перечислите интересы через запятую (например: Python, музыка, дизайн)."
-            )
-            await state.update_data(last_kb_mid=None)
-            return
 
-        # INTERESTS
-        if user.stage == "profile_interests":
-            interests, err = normalize_interests(text, settings.banned_words)
-            if err:
-                await message.answer("⚠️ " + err)
-                await session.commit()
+            # INTERESTS
+            if user.stage == "profile_interests":
+                interests, err = normalize_interests(text, settings.banned_words_set)
+                if err:
+                    await message.answer("⚠️ " + err)
+                    await session.commit()
+                    return
+                user.interests_json = {"interests": interests or []}
+                user.stage = "profile_review"
+                # для предпросмотра нужны все поля анкеты — догружаем их в тот же объект
+                # до коммита: дальше сессия занята им
+                await session.execute(
+                    select(User).options(*_FULL).where(User.id == user.id)
+                )
+                async with _commit_alongside(session):
+                    await state.set_state(ProfileStates.profile_review)
+                    fsm["preview"] = None
+                    # send preview with attached photos (if any)
+                    await _send_profile_preview_with_photos(
+                        message.bot,
+                        message.chat.id,
+                        user,
+                        kb_profile_review(),
+                        data,
+                        fsm,
+                    )
                 return
-            user.interests_json = {"interests": interests or []}
-            user.stage = "profile_review"
-            await session.commit()
-            # send preview with attached photos (if any)
-            await _send_profile_preview_with_photos(
-                message.bot, message.chat.id, user, state, kb_profile_review()
-            )
-            return
+    finally:
+        await _save_fsm(state, fsm)
 
 
 # --------------------------- photo ------------------------------ #
@@ -403,37 +585,51 @@ async def cb_photo_from_profile(
     session_factory: async_sessionmaker[AsyncSession],
     settings: Settings,
 ) -> None:
+    bot, chat_id = cq.bot, cq.message.chat.id
+    spawn(drop_kb(cq.message))
+    # фото профиля запрашиваем параллельно с загрузкой пользователя из БД
+    photos_task = asyncio.create_task(
+        bot.get_user_profile_photos(cq.from_user.id, limit=3)
+    )
+    fsm: dict = {}
     try:
-        await cq.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
-    async with session_factory() as session:
-        user = await _user(session, cq.from_user.id)
-        user.last_activity = datetime.now(timezone.utc)
+        async with session_factory() as session:
+            user = await _user(
+                session,
+                cq.from_user.id,
+                light=True,
+                data=await state.get_data(),
+                fsm=fsm,
+            )
+            touch(user.telegram_id)
 
-        if user.stage != "profile_photo":
-            await session.commit()
-            await cq.answer("Не на шаге фото.")
-            return
+            if user.stage != "profile_photo":
+                await session.commit()
+                await _save_fsm(state, fsm)
+                await cq.answer("Не на шаге фото.")
+                return
 
-        photos = await cq.message.bot.get_user_profile_photos(user.telegram_id, limit=3)
-        count = 0
-        for p in photos.photos:
-            if not p:
-                continue
-            file_id = p[-1].file_id
-            _append_photo(user, file_id)
-            count += 1
-            if count >= 3:
-                break
+            photos = await photos_task
+            # все фото — одним списком и одним UPDATE
+            await _append_photos(
+                session, user, [p[-1].file_id for p in photos.photos[:3] if p]
+            )
 
-        user.stage = "profile_bio"
-        await session.commit()
-        await cq.message.answer(
-            "Фото добавлены. Теперь расскажите о себе (до 500 символов):"
-        )
-        await state.update_data(last_kb_mid=None)
-        await cq.answer()
+            user.stage = "profile_bio"
+            await session.commit()
+            await state.set_state(ProfileStates.profile_bio)
+            await bot.send_message(
+                chat_id, "Фото добавлены. Теперь расскажите о себе (до 500 символов):"
+            )
+            fsm.update(last_kb_mid=None, preview=None)
+            await _save_fsm(state, fsm)
+            await cq.answer()
+    finally:
+        # до ожидания дело могло не дойти (не тот шаг, ошибка БД): задачу не бросаем
+        if not photos_task.done():
+            photos_task.cancel()
+        elif not photos_task.cancelled():
+            photos_task.exception()  # ошибку API помечаем полученной — без лишнего лога
 
 
 @router.callback_query(F.data == "prof:photo:skip")
@@ -443,27 +639,28 @@ async def cb_photo_skip(
     session_factory: async_sessionmaker[AsyncSession],
     settings: Settings,
 ) -> None:
-    try:
-        await cq.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
+    bot, chat_id = cq.bot, cq.message.chat.id
+    spawn(drop_kb(cq.message))
     async with session_factory() as session:
-        user = await _user(session, cq.from_user.id)
-        user.last_activity = datetime.now(timezone.utc)
-        if user.stage != "profile_photo":
-            await session.commit()
+        user = await _set_stage(
+            session,
+            cq.from_user.id,
+            "profile_bio",
+            from_stage="profile_photo",
+            state=state,
+        )
+        await session.commit()
+        if user is None:
             await cq.answer()
             return
-        user.stage = "profile_bio"
-        await session.commit()
-        await cq.message.answer(
-            "Хорошо, можно без фото. Расскажите о себе (до 500 символов):"
+        await bot.send_message(
+            chat_id, "Хорошо, можно без фото. Расскажите о себе (до 500 символов):"
         )
-        await state.update_data(last_kb_mid=None)
+        await _save_fsm(state, {"last_kb_mid": None})
         await cq.answer()
 
 
-@router.message(F.photo)
+@router.message(StateFilter(None, ProfileStates.profile_photo), F.photo)
 async def on_photo(
     message: Message,
     state: FSMContext,
@@ -471,38 +668,90 @@ async def on_photo(
     settings: Settings,
 ) -> None:
     """Принимает 1–3 фото; можно присылать по одному или альбомом."""
-    async with session_factory() as session:
-        user = await _user(session, message.from_user.id)
-        user.last_activity = datetime.now(timezone.utc)
+    file_id = message.photo[-1].file_id
+    if not message.media_group_id:
+        await _save_photos(
+            message.bot,
+            message.chat.id,
+            message.from_user.id,
+            state,
+            session_factory,
+            [file_id],
+        )
+        return
 
-        if user.status == "blocked":
-            await session.commit()
-            return
-        if user.stage != "profile_photo":
-            await session.commit()
-            return
+    # альбом приходит отдельным апдейтом на каждое фото — копим и сохраняем один раз
+    key = (message.chat.id, message.media_group_id)
+    album = _ALBUMS.setdefault(key, {"file_ids": [], "timer": None})
+    album["file_ids"].append(file_id)
+    if album["timer"] is not None:
+        album["timer"].cancel()
+    album["timer"] = asyncio.get_running_loop().call_later(
+        _ALBUM_DELAY,
+        _flush_album,
+        key,
+        message.bot,
+        message.from_user.id,
+        state,
+        session_factory,
+    )
 
-        # гасим предыдущие кнопки, если были
-        await _clear_last_kb(state, message.chat.id, message.bot)
 
-        file_id = message.photo[-1].file_id
-        _append_photo(user, file_id)
+def _flush_album(key, bot, tg_id: int, state: FSMContext, session_factory) -> None:
+    album = _ALBUMS.pop(key, None)
+    if album:
+        spawn(
+            _save_photos(bot, key[0], tg_id, state, session_factory, album["file_ids"])
+        )
+
+
+async def _save_photos(
+    bot,
+    chat_id: int,
+    tg_id: int,
+    state: FSMContext,
+    session_factory: async_sessionmaker[AsyncSession],
+    file_ids: list[str],
+) -> None:
+    """Сохраняет пачку фото одним коммитом и отвечает одним сообщением."""
+    data = await state.get_data()
+    fsm: dict = {}
+    try:
+        async with session_factory() as session:
+            user = await _user(session, tg_id, light=True, data=data, fsm=fsm)
+            touch(user.telegram_id)
+
+            if user.status == "blocked":
+                await session.commit()
+                return
+            if user.stage != "profile_photo":
+                await session.commit()
+                return
+
+            # гасим предыдущие кнопки, если были
+            _clear_last_kb(data, fsm, chat_id, bot)
+
+            count = await _append_photos(session, user, file_ids)
+
+            if count >= 3:
+                user.stage = "profile_bio"
+                await session.commit()
+                await state.set_state(ProfileStates.profile_bio)
+                await bot.send_message(
+                    chat_id,
+                    "Принял 3 фото. Теперь расскажите о себе (до 500 символов):",
+                )
+                fsm.update(last_kb_mid=None, preview=None)
+                return
 
-        if _photos_count(user) >= 3:
-            user.stage = "profile_bio"
             await session.commit()
-            await message.answer(
-                "Принял 3 фото. Теперь расскажите о себе (до 500 символов):"
+            await bot.send_message(
+                chat_id,
+                f"Фото сохранено ({count}/3). Можно отправить ещё или нажать «Пропустить ▶️».",
             )
-            await state.update_data(last_kb_mid=None)
-            return
-
-        await session.commit()
-        await message.answer(
-            f"Фото сохранено ({_photos_count(user)}/3). Можно отправить ещё или нажать «Пропустить ▶️»."
-        )
-        await state.update_data(last_kb_mid=None)  # без клавиатуры
-        return
+            fsm.update(last_kb_mid=None, preview=None)  # без клавиатуры
+    finally:
+        await _save_fsm(state, fsm)
 
 
 # --------------------------- review / save ---------------------- #
@@ -515,18 +764,15 @@ async def cb_prof_save(
     session_factory: async_sessionmaker[AsyncSession],
     settings: Settings,
 ) -> None:
-    try:
-        await cq.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
+    bot, chat_id = cq.bot, cq.message.chat.id
+    spawn(drop_kb(cq.message))
     async with session_factory() as session:
-        user = await _user(session, cq.from_user.id)
-        user.stage = "profile_filled"
-        await session.commit()
-        sent = await cq.message.answer(
-            "Анкета сохранена! 🎉", reply_markup=kb_profile_filled()
-        )
-        await state.update_data(last_kb_mid=sent.message_id)
+        await _set_stage(session, cq.from_user.id, "profile_filled", state=state)
+        async with _commit_alongside(session):
+            sent = await bot.send_message(
+                chat_id, "Анкета сохранена! 🎉", reply_markup=kb_profile_filled()
+            )
+            await _save_fsm(state, {"last_kb_mid": sent.message_id})
         await cq.answer()
 
 
@@ -537,63 +783,59 @@ async def cb_prof_edit_review(
     session_factory: async_sessionmaker[AsyncSession],
     settings: Settings,
 ) -> None:
-    try:
-        await cq.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
+    bot, chat_id = cq.bot, cq.message.chat.id
+    spawn(drop_kb(cq.message))
     async with session_factory() as session:
-        user = await _user(session, cq.from_user.id)
-        user.stage = "profile_review"
+        user = await _set_stage(
+            session, cq.from_user.id, "profile_review", state=state, full=True
+        )
         await session.commit()
         # send preview with attached photos (if any)
+        fsm: dict = {}
         await _send_profile_preview_with_photos(
-            cq.message.bot, cq.message.chat.id, user, state, kb_profile_review()
+            bot, chat_id, user, kb_profile_review(), await state.get_data(), fsm
         )
+        await _save_fsm(state, fsm)
         await cq.answer()
 
 
-@router.callback_query(F.data.startswith("prof:edit:"))
+# callback_data -> (стадия анкеты, подсказка, фабрика клавиатуры или None)
+_EDIT_TABLE = {
+    "prof:edit:name": ("profile_name", "Давайте заполним анкету! Как вас зовут?", None),
+    "prof:edit:photo": (
+        "profile_photo",
+        "Отправьте до 3 фото (можно альбомом) или нажмите:",
+        kb_profile_photo,
+    ),
+    "prof:edit:bio": ("profile_bio", "Расскажите о себе (до 500 символов):", None),
+    "prof:edit:age": ("profile_age", "Введите ваш возраст (18–50):", None),
+    "prof:edit:interests": (
+        "profile_interests",
+        "Перечислите интересы через запятую.",
+        None,
+    ),
+}
+
+
+@router.callback_query(F.data.in_(_EDIT_TABLE.keys()))
 async def cb_prof_edit_field(
     cq: CallbackQuery,
     state: FSMContext,
     session_factory: async_sessionmaker[AsyncSession],
     settings: Settings,
 ) -> None:
-    try:
-        await cq.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
-    field = cq.data.split(":", 2)[2]
+    """«Изменить поле»: возвращаем пользователя на нужную стадию анкеты."""
+    stage, text, kb = _EDIT_TABLE[cq.data]
+    reply_markup = kb() if kb else None
+    bot, chat_id = cq.bot, cq.message.chat.id
+    spawn(drop_kb(cq.message))
     async with session_factory() as session:
-        user = await _user(session, cq.from_user.id)
-        if field == "name":
-            user.stage = "profile_name"
-            await session.commit()
-            await cq.message.answer("Давайте заполним анкету! Как вас зовут?")
-            await state.update_data(last_kb_mid=None)
-        elif field == "photo":
-            user.stage = "profile_photo"
-            await session.commit()
-            sent = await cq.message.answer(
-                "Отправьте до 3 фото (можно альбомом) или нажмите:",
-                reply_markup=kb_profile_photo(),
-            )
-            await state.update_data(last_kb_mid=sent.message_id)
-        elif field == "bio":
-            user.stage = "profile_bio"
-            await session.commit()
-            await cq.message.answer("Расскажите о себе (до 500 символов):")
-            await state.update_data(last_kb_mid=None)
-        elif field == "age":
-            user.stage = "profile_age"
-            await session.commit()
-            await cq.message.answer("Введите ваш возраст (18–50):")
-            await state.update_data(last_kb_mid=None)
-        elif field == "interests":
-            user.stage = "profile_interests"
-            await session.commit()
-            await cq.message.answer("Перечислите интересы через запятую.")
-            await state.update_data(last_kb_mid=None)
+        await _set_stage(session, cq.from_user.id, stage, state=state)
+        await session.commit()
+        sent = await bot.send_message(chat_id, text, reply_markup=reply_markup)
+        await _save_fsm(
+            state, {"last_kb_mid": sent.message_id if reply_markup else None}
+        )
         await cq.answer()
 
 
@@ -604,12 +846,10 @@ async def cb_prof_join(
     session_factory: async_sessionmaker[AsyncSession],
     settings: Settings,
 ) -> None:
-    try:
-        await cq.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
-    await cq.message.answer(
-        "Отлично! Вы будете участвовать в подборе, когда это станет доступно."
+    bot, chat_id = cq.bot, cq.message.chat.id
+    spawn(drop_kb(cq.message))
+    await bot.send_message(
+        chat_id, "Отлично! Вы будете участвовать в подборе, когда это станет доступно."
     )
-    await state.update_data(last_kb_mid=None)
+    await _save_fsm(state, {"last_kb_mid": None})
     await cq.answer()
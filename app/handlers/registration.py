@@ -13,36 +13,136 @@
 
 from __future__ import annotations
 
-import uuid
-from datetime import timedelta
+import hmac
+import secrets
+import time
+from datetime import datetime, timedelta
 
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.filters import StateFilter
 
-from sqlalchemy import select, desc
+from sqlalchemy import bindparam, delete, desc, func, or_, select, text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import aliased
 
 from ..config import Settings
 from ..keyboards import kb_auth_code_wait, kb_start_authorized, kb_admin_decision
 from ..models import User, Otp, AuthAttempt, AdminLog
+from ..states import AuthStates, stage_state
 from ..utils.email_sender import send_otp_email
-from ..utils.security import validate_email, generate_otp
+from ..utils.security import validate_email, generate_otp, hash_otp
+from ..utils.activity import touch
+from ..utils.background import spawn
+from ..utils.kb import clear_last_kb
 from ..utils.dt import now_utc, ensure_aware_utc
 
 router = Router()
 
+# длина OTP-кода: столько цифр генерируем и только такой текст считаем кодом
+_OTP_LEN = 6
+
+# telegram_id -> time.monotonic() последней отправки OTP этим процессом (после коммита).
+# Позволяет ответить на частые «переотправить» без обращения к БД; источник истины —
+# otps.last_sent_at. Ключ — telegram_id: для проверки не нужна строка users.
+_OTP_LAST_SENT: dict[int, float] = {}
+_OTP_LAST_SENT_MAX = 50_000
+_COOLDOWN_WARN = "Повторная отправка возможна не чаще, чем раз в 120 секунд."
+
+# Запись попытки и удаление старых одним запросом (PostgreSQL). Подзапросы CTE видят
+# таблицу до вставки, поэтому из прежних записей оставляем 2 — с новой их будет 3.
+_LOG_ATTEMPT_PG = text(
+    """
+    WITH ins AS (
+        INSERT INTO auth_attempts (user_id, type, value) VALUES (:uid, :typ, :value)
+    )
+    DELETE FROM auth_attempts
+    WHERE user_id = :uid AND type = :typ
+      AND id NOT IN (
+        SELECT id FROM auth_attempts
+        WHERE user_id = :uid AND type = :typ
+        ORDER BY ts DESC, id DESC
+        LIMIT 2
+      )
+    """
+)
+
+# Запросы собраны один раз на модуль, значения — через bindparam: без построения
+# выражений на каждый апдейт, скомпилированный SQL берётся из кэша движка.
+_SEL_USER = select(User).where(User.telegram_id == bindparam("tg_id"))
+_SEL_USER_OR_EMAIL_OWNER = select(User).where(
+    or_(
+        User.telegram_id == bindparam("tg_id"),
+        # по функциональному индексу uq_users_email_lower
+        func.lower(User.email) == bindparam("email_lc"),
+    )
+)
+_newest_otp = aliased(Otp)
+_SEL_USER_AND_LAST_OTP = (
+    select(User, Otp)
+    .outerjoin(
+        Otp,
+        Otp.id
+        == (
+            select(_newest_otp.id)
+            .where(_newest_otp.user_id == User.id)
+            .order_by(desc(_newest_otp.created_at))
+            .limit(1)
+            .correlate(User)
+            .scalar_subquery()
+        ),
+    )
+    .where(User.telegram_id == bindparam("tg_id"))
+)
+_keep_attempts = (
+    select(AuthAttempt.id)
+    .where(
+        AuthAttempt.user_id == bindparam("uid"), AuthAttempt.type == bindparam("typ")
+    )
+    .order_by(desc(AuthAttempt.ts), desc(AuthAttempt.id))
+    .limit(3)
+    .subquery()
+)
+_TRIM_ATTEMPTS = (
+    delete(AuthAttempt)
+    .where(
+        AuthAttempt.user_id == bindparam("uid"),
+        AuthAttempt.type == bindparam("typ"),
+        AuthAttempt.id.not_in(select(_keep_attempts.c.id)),
+    )
+    .execution_options(synchronize_session=False)
+)
+_SEL_LAST_ATTEMPTS = (
+    select(AuthAttempt)
+    .where(
+        AuthAttempt.user_id == bindparam("uid"), AuthAttempt.type == bindparam("typ")
+    )
+    .order_by(desc(AuthAttempt.ts))
+    .limit(bindparam("lim"))
+)
+_SEL_PENDING_OTP = (
+    select(Otp)
+    .where(Otp.user_id == bindparam("uid"), Otp.used_at.is_(None))
+    .order_by(desc(Otp.created_at))
+    .limit(1)
+)
+
 
 # --------------------------- helpers ---------------------------- #
 
 
 async def _user(session: AsyncSession, tg_id: int) -> User:
     """Возвращает пользователя или создаёт нового (status=new, stage=new, origin='self')."""
-    res = await session.execute(select(User).where(User.telegram_id == tg_id))
+    res = await session.execute(_SEL_USER, {"tg_id": tg_id})
     user = res.scalar_one_or_none()
     if user:
         return user
+    return await _create_user(session, tg_id)
+
+
+async def _create_user(session: AsyncSession, tg_id: int) -> User:
     # Если пользователя нет — создаём (аналогично /start)
     user = User(
         telegram_id=tg_id, username=None, status="new", stage="new", origin="self"
@@ -52,72 +152,86 @@ async def _user(session: AsyncSession, tg_id: int) -> User:
     return user
 
 
+async def _user_and_email_owner(
+    session: AsyncSession, tg_id: int, email: str
+) -> tuple[User, User | None]:
+    """
+    Пользователь (создаётся, если его нет) и другой владелец этого e-mail
+    (без учёта регистра) — одним SELECT.
+    """
+    res = await session.execute(
+        _SEL_USER_OR_EMAIL_OWNER, {"tg_id": tg_id, "email_lc": email.lower()}
+    )
+    user = owner = None
+    for row in res.scalars():
+        if row.telegram_id == tg_id:
+            user = row
+        else:
+            owner = row
+    if user is None:
+        user = await _create_user(session, tg_id)
+    return user, owner
+
+
+async def _user_and_last_otp(
+    session: AsyncSession, tg_id: int
+) -> tuple[User, Otp | None]:
+    """
+    Пользователь (создаётся, если его нет) и его последний OTP — одним SELECT.
+    """
+    row = (await session.execute(_SEL_USER_AND_LAST_OTP, {"tg_id": tg_id})).first()
+    if row is None:
+        return await _create_user(session, tg_id), None
+    return row[0], row[1]
+
+
+def _looks_like_code(text: str) -> bool:
+    # generate_otp всегда выдаёт _OTP_LEN цифр: сначала дешёвая проверка длины;
+    # isascii: isdigit() пропускает и не-ASCII цифры (например, «٣»)
+    return len(text) == _OTP_LEN and text.isascii() and text.isdigit()
+
+
 async def _log_attempt(
     session: AsyncSession, user_id: int, typ: str, value: str
 ) -> None:
     # Сохраним попытку и оставим только последние 3 для данного user_id/type
+    if session.get_bind().dialect.name == "postgresql":
+        await session.execute(
+            _LOG_ATTEMPT_PG, {"uid": user_id, "typ": typ, "value": value}
+        )
+        return
     session.add(AuthAttempt(user_id=user_id, type=typ, value=value))
     await session.flush()
-    # Оставляем только последние 3 записи; удаляем более старые
-    q = (
-        select(AuthAttempt)
-        .where(AuthAttempt.user_id == user_id, AuthAttempt.type == typ)
-        .order_by(desc(AuthAttempt.ts))
-    )
-    rows = list((await session.execute(q)).scalars())
-    if len(rows) > 3:
-        for old in rows[3:]:
-            session.delete(old)
+    # Оставляем только последние 3 записи: более старые удаляем одним DELETE
+    await session.execute(_TRIM_ATTEMPTS, {"uid": user_id, "typ": typ})
 
 
 async def _last_attempts(
     session: AsyncSession, user_id: int, typ: str, limit: int = 3
 ) -> list[AuthAttempt]:
-    q = (
-        select(AuthAttempt)
-        .where(AuthAttempt.user_id == user_id, AuthAttempt.type == typ)
-        .order_by(desc(AuthAttempt.ts))
-        .limit(limit)
+    res = await session.execute(
+        _SEL_LAST_ATTEMPTS, {"uid": user_id, "typ": typ, "lim": limit}
     )
-    return list((await session.execute(q)).scalars())
-
-
-async def _clear_last_kb(state: FSMContext, chat_id: int, bot) -> None:
-    """Снимает клавиатуру у последнего нашего сообщения, если оно есть."""
-    data = await state.get_data()
-    mid = data.get("last_kb_mid")
-    if mid:
-        try:
-            await bot.edit_message_reply_markup(
-                chat_id=chat_id, message_id=mid, reply_markup=None
-            )
-        except Exception:
-            pass
-        await state.update_data(last_kb_mid=None)
+    return list(res.scalars())
 
 
 async def _send_or_resend_otp(
-    session: AsyncSession, settings: Settings, user: User
+    session: AsyncSession, settings: Settings, user: User, now: datetime
 ) -> tuple[bool, str | None]:
     """
     Создаёт новую "сессию" OTP, либо переотправляет существующую с соблюдением ограничений:
     - не чаще 1 раза в 120 секунд,
     - не более 3 переотправок за одну сессию,
     - TTL кода settings.otp_ttl_seconds.
+    now — момент обработки апдейта (один на хендлер): created_at/last_sent_at/expires_at
+    считаются от него.
     """
-    now = now_utc()
+    if _in_otp_cooldown(user.telegram_id, settings):
+        return True, _COOLDOWN_WARN
 
     existing = (
-        (
-            await session.execute(
-                select(Otp)
-                .where(Otp.user_id == user.id, Otp.used_at.is_(None))
-                .order_by(desc(Otp.created_at))
-            )
-        )
-        .scalars()
-        .first()
-    )
+        await session.execute(_SEL_PENDING_OTP, {"uid": user.id})
+    ).scalar_one_or_none()
 
     warn: str | None = None
 
@@ -131,24 +245,29 @@ async def _send_or_resend_otp(
                 and (ex_last_sent_at + timedelta(seconds=settings.otp_cooldown_seconds))
                 > now
             ):
-                warn = "Повторная отправка возможна не чаще, чем раз в 120 секунд."
+                warn = _COOLDOWN_WARN
             else:
                 if existing.resend_count >= settings.resend_max_per_session:
                     warn = "Достигнут лимит переотправок для этой сессии."
                 else:
-                    await send_otp_email(settings, user.email, existing.code)
+                    # в БД только хеш: переотправляем новый код в той же сессии
+                    # (срок действия прежний), старый перестаёт подходить
+                    code = generate_otp(_OTP_LEN)
+                    await send_otp_email(settings, user.email, code)
+                    existing.code = hash_otp(code, settings.otp_pepper)
                     existing.resend_count += 1
                     existing.last_sent_at = now
+                    _otp_sent_in(session, user)
                     warn = "Код отправлен повторно."
             return True, warn
 
-    code = generate_otp(6)
-    session_id = uuid.uuid4().hex[:8]
+    code = generate_otp(_OTP_LEN)
+    session_id = secrets.token_hex(4)
     expires = now + timedelta(seconds=settings.otp_ttl_seconds)
 
     otp = Otp(
         user_id=user.id,
-        code=code,
+        code=hash_otp(code, settings.otp_pepper),
         session_id=session_id,
         resend_count=0,
         last_sent_at=now,
@@ -157,23 +276,48 @@ async def _send_or_resend_otp(
     )
     session.add(otp)
     await send_otp_email(settings, user.email, code)
+    _otp_sent_in(session, user)
     return True, warn
 
 
-async def _notify_admin_on_block(
+def _in_otp_cooldown(tg_id: int, settings: Settings) -> bool:
+    """Этот процесс отправил код недавно: код ещё жив и cooldown не прошёл."""
+    sent_at = _OTP_LAST_SENT.get(tg_id)
+    return sent_at is not None and time.monotonic() - sent_at < min(
+        settings.otp_cooldown_seconds, settings.otp_ttl_seconds
+    )
+
+
+def _otp_sent_in(session: AsyncSession, user: User) -> None:
+    """Помечает отправку в сессии; в _OTP_LAST_SENT она попадёт только после коммита."""
+    session.info["otp_sent_to"] = user.telegram_id
+
+
+def _remember_otp_sent(session: AsyncSession) -> None:
+    """После коммита: запоминает отправку, помеченную в сессии (_otp_sent_in)."""
+    tg_id = session.info.pop("otp_sent_to", None)
+    if tg_id is None:
+        return
+    if len(_OTP_LAST_SENT) >= _OTP_LAST_SENT_MAX:
+        _OTP_LAST_SENT.clear()
+    _OTP_LAST_SENT[tg_id] = time.monotonic()
+
+
+async def _log_block_request(
     session: AsyncSession,
     settings: Settings,
     user: User,
     reason: str,
     typ: str,
-    bot,
     sender_name: str,
-) -> None:
+) -> str | None:
     """
-    Создаёт запись в admin_log и отправляет уведомление в admin_chat (с кнопками блок/разблок).
+    Добавляет в сессию запись admin_log о заявке и возвращает текст уведомления для
+    admin_chat (None — админ-чат не настроен). Запись уходит в БД общим коммитом
+    вызывающего вместе с блокировкой, уведомление отправляется после него (_notify_admins).
     """
     if not settings.admin_chat_id:
-        return
+        return None
     attempts = await _last_attempts(session, user.id, typ)
     payload = {
         "user_id": user.id,
@@ -188,226 +332,248 @@ async def _notify_admin_on_block(
             payload=payload,
         )
     )
-    # Сохраняем запись в БД, чтобы в admin_log было видно заявку
-    await session.commit()
-    # Отправляем сообщение в админ-чат с последними попытками и кнопками для принятия решения
-    try:
-        text = (
-            f"❗️Неудачный вход\n"
-            f"👤: {sender_name}\n"
-            f"🔗: {'@' + user.username if user.username else 'нет username'}\n"
-            f"🆔: {user.telegram_id}\n\n"
-            f"Причина: {reason}\n"
-            f"Последние {typ} попытки: {', '.join([a.value for a in attempts]) if attempts else 'нет данных'}"
-        )
-        await bot.send_message(
-            chat_id=settings.admin_chat_id,
-            text=text,
-            reply_markup=kb_admin_decision(user.id),
-        )
-    except Exception:
-        # Не фейлим основную операцию из-за ошибки отправки нотификации
-        pass
+    return (
+        f"❗️Неудачный вход\n"
+        f"👤: {sender_name}\n"
+        f"🔗: {'@' + user.username if user.username else 'нет username'}\n"
+        f"🆔: {user.telegram_id}\n\n"
+        f"Причина: {reason}\n"
+        f"Последние {typ} попытки: {', '.join([a.value for a in attempts]) if attempts else 'нет данных'}"
+    )
+
+
+async def _notify_admins(bot, settings: Settings, user_id: int, text: str) -> None:
+    """
+    Сообщение в админ-чат с последними попытками и кнопками для принятия решения.
+    Запускается в фоне (spawn): ответ пользователю его не ждёт, ошибка отправки
+    пишется в лог и основную операцию не ломает.
+    """
+    await bot.send_message(
+        chat_id=settings.admin_chat_id,
+        text=text,
+        reply_markup=kb_admin_decision(user_id),
+    )
 
 
 # ------------------------- email / code ------------------------- #
 
 
-@router.message(F.text & ~F.text.startswith("/"))
+@router.message(
+    StateFilter(
+        None,
+        AuthStates.verifying_email,
+        AuthStates.verifying_email_error,
+        AuthStates.verifying_code,
+        AuthStates.verifying_code_error,
+    ),
+    F.text & ~F.text.startswith("/"),
+)
 async def on_email_or_code(
     message: Message,
     state: FSMContext,
     session_factory: async_sessionmaker[AsyncSession],
     settings: Settings,
+    raw_state: str | None = None,
 ) -> None:
     """
     Текст обрабатываем ТОЛЬКО на стадиях регистрации: verifying_email*, verifying_code*.
     На шаги анкеты не претендуем — их ловит profile.py.
+    Стадия дублируется в состояние FSM (AuthStates): сообщения пользователей на других
+    стадиях отсекает StateFilter без запроса к БД. Без состояния (новый пользователь,
+    перезапуск с MemoryStorage) решаем по users.stage и заодно выставляем состояние.
+    Все изменения — одна транзакция с коммитом на выходе из блока; ответ, состояние FSM
+    и уведомление админов отправляются уже после коммита.
     """
-    async with session_factory() as session:
-        user = await _user(session, message.from_user.id)
-        # Обрабатываем только свои стадии — если не наша стадия, отменяем обработчик
-        if user.stage not in {
+    text = (message.text or "").strip()
+    now = now_utc()
+    reply: str | None = None
+    reply_markup = None
+    notice: str | None = None
+    async with session_factory.begin() as session:
+        # похожий на e-mail текст: заодно находим, не занят ли адрес другим аккаунтом
+        if "@" in text:
+            user, email_owner = await _user_and_email_owner(
+                session, message.from_user.id, text
+            )
+            last_otp = None
+        # похожий на код: сразу берём и последний OTP пользователя
+        elif _looks_like_code(text):
+            user, last_otp = await _user_and_last_otp(session, message.from_user.id)
+            email_owner = None
+        else:
+            user = await _user(session, message.from_user.id)
+            email_owner = last_otp = None
+
+        # Обрабатываем только свои стадии — иначе после коммита отменяем обработчик
+        ours = user.stage in {
             "new",
             "verifying_email",
             "verifying_email_error",
             "verifying_code",
             "verifying_code_error",
-        }:
-            await session.commit()
-            raise SkipHandler()
-
-        # Снимем старые кнопки, если были
-        await _clear_last_kb(state, message.chat.id, message.bot)
+        }
+        if ours:
+            # Снимем старые кнопки, если были
+            await clear_last_kb(state, message.chat.id, message.bot)
+            touch(user.telegram_id, now)
+            reply, reply_markup, notice = await _email_or_code_step(
+                session, settings, message, user, text, now, email_owner, last_otp
+            )
+    # транзакция зафиксирована — теперь отправленный код можно учитывать в cooldown
+    _remember_otp_sent(session)
+
+    # состояние FSM следует за users.stage
+    target = stage_state(user.stage)
+    if (target.state if target else None) != raw_state:
+        await state.set_state(target)
+    if not ours:
+        raise SkipHandler()
+    # админов уведомляем только о зафиксированной блокировке
+    if notice:
+        spawn(_notify_admins(message.bot, settings, user.id, notice))
+    if reply:
+        sent = await message.answer(reply, reply_markup=reply_markup)
+        if reply_markup is not None:
+            await state.update_data(last_kb_mid=sent.message_id)
 
-        user.last_activity = now_utc()
-        text = (message.text or "").strip()
 
-        if user.status == "blocked":
-            await session.commit()
-            await message.answer(
-                "Доступ временно заблокирован. Свяжитесь с администратором."
+async def _email_or_code_step(
+    session: AsyncSession,
+    settings: Settings,
+    message: Message,
+    user: User,
+    text: str,
+    now: datetime,
+    email_owner: User | None,
+    last_otp: Otp | None,
+) -> tuple[str | None, object, str | None]:
+    """
+    Шаг регистрации внутри транзакции on_email_or_code, без коммитов и отправки сообщений.
+    Возвращает (текст ответа, клавиатура, уведомление админам).
+    """
+    if user.status == "blocked":
+        return "Доступ временно заблокирован. Свяжитесь с администратором.", None, None
+
+    # E-MAIL
+    if user.stage in {"new", "verifying_email", "verifying_email_error"}:
+        email = text
+        await _log_attempt(session, user.id, "email", email)
+
+        if email_owner is not None:
+            return (
+                "Этот email уже привязан к другому аккаунту. Если это ошибка — обратитесь к администратору.",
+                None,
+                None,
             )
-            return
-
-        # E-MAIL
-        if user.stage in {"new", "verifying_email", "verifying_email_error"}:
-            email = text
-            await _log_attempt(session, user.id, "email", email)
 
-            exists = (
-                await session.execute(
-                    select(User).where(
-                        User.email == email, User.telegram_id != user.telegram_id
-                    )
+        ok, err = validate_email(email, settings)
+        if not ok:
+            user.email_attempts += 1
+            user.stage = "verifying_email"
+            if user.email_attempts > settings.email_max_attempts:
+                user.status = "blocked"
+                user.stage = "verifying_email_error"
+                notice = await _log_block_request(
+                    session,
+                    settings,
+                    user,
+                    "Слишком много неверных адресов",
+                    "email",
+                    message.from_user.full_name,
                 )
-            ).scalar_one_or_none()
-            if exists:
-                await session.commit()
-                await message.answer(
-                    "Этот email уже привязан к другому аккаунту. Если это ошибка — обратитесь к администратору."
+                return (
+                    "Слишком много неверных адресов. Доступ заблокирован, администратор уведомлён, ожидайте решения.",
+                    None,
+                    notice,
                 )
-                return
-
-            ok, err = validate_email(
-                email, settings.email_regex, settings.allowed_domains
+            return (
+                f"⚠️ {err}\nПопробуйте ещё раз (корпоративный e-mail).\nПопыток осталось: {settings.email_max_attempts - user.email_attempts + 1}",
+                None,
+                None,
             )
-            if not ok:
-                user.email_attempts += 1
-                user.stage = "verifying_email"
-                if user.email_attempts > settings.email_max_attempts:
-                    user.status = "blocked"
-                    user.stage = "verifying_email_error"
-                    await _notify_admin_on_block(
-                        session,
-                        settings,
-                        user,
-                        "Слишком много неверных адресов",
-                        "email",
-                        message.bot,
-                        message.from_user.full_name,
-                    )
-                    await session.commit()
-                    await message.answer(
-                        "Слишком много неверных адресов. Доступ заблокирован, администратор уведомлён, ожидайте решения."
-                    )
-                    return
-                await session.commit()
-                await message.answer(
-                    f"⚠️ {err}\nПопробуйте ещё раз (корпоративный e-mail).\nПопыток осталось: {settings.email_max_attempts - user.email_attempts + 1}"
-                )
-                return
 
-            user.email = email
-            user.email_attempts = 0
-            user.stage = "verifying_code"
-            ok, warn = await _send_or_resend_otp(session, settings, user)
-            await session.commit()
-            msg = (
-                "Отправили 6-значный код на вашу почту. Введите его в течение 2 минут."
+        user.email = email
+        user.email_attempts = 0
+        user.stage = "verifying_code"
+        ok, warn = await _send_or_resend_otp(session, settings, user, now)
+        msg = "Отправили 6-значный код на вашу почту. Введите его в течение 2 минут."
+        if warn:
+            msg += f"\n⚠️ {warn}"
+        return msg, kb_auth_code_wait(), None
+
+    # OTP
+    if user.stage in {"verifying_code", "verifying_code_error"}:
+        if not _looks_like_code(text):
+            return "Ожидаю код из письма (6 цифр).", None, None
+
+        code = text
+        await _log_attempt(session, user.id, "otp", code)
+
+        # последний OTP уже загружен вместе с пользователем (_user_and_last_otp)
+        otp_row = last_otp
+
+        if not otp_row:
+            return (
+                f"Код не найден. Отправить новый код на {user.email}?",
+                kb_auth_code_wait(),
+                None,
             )
-            if warn:
-                msg += f"\n⚠️ {warn}"
-            sent = await message.answer(msg, reply_markup=kb_auth_code_wait())
-            await state.update_data(last_kb_mid=sent.message_id)
-            return
 
-        # OTP
-        if user.stage in {"verifying_code", "verifying_code_error"}:
-            if not text.isdigit() or not (4 <= len(text) <= 8):
-                await message.answer("Ожидаю код из письма (4–8 цифр).")
-                await session.commit()
-                return
-
-            code = text
-            await _log_attempt(session, user.id, "otp", code)
-
-            now = now_utc()
-            otp_row = (
-                (
-                    await session.execute(
-                        select(Otp)
-                        .where(Otp.user_id == user.id)
-                        .order_by(desc(Otp.created_at))
-                    )
-                )
-                .scalars()
-                .first()
-            )
+        exp = ensure_aware_utc(otp_row.expires_at)
+        used_at = ensure_aware_utc(otp_row.used_at)
 
-            if not otp_row:
-                await session.commit()
-                sent = await message.answer(
-                    f"Код не найден. Отправить новый код на {user.email}?",
-                    reply_markup=kb_auth_code_wait(),
-                )
-                await state.update_data(last_kb_mid=sent.message_id)
-                return
+        if not exp or exp <= now:
+            return (
+                f"Код истёк. Отправить новый код на {user.email}?",
+                kb_auth_code_wait(),
+                None,
+            )
 
-            exp = ensure_aware_utc(otp_row.expires_at)
-            used_at = ensure_aware_utc(otp_row.used_at)
+        if used_at:
+            return (
+                "Код уже был использован. Запросите новый.",
+                kb_auth_code_wait(),
+                None,
+            )
 
-            if not exp or exp <= now:
-                await session.commit()
-                sent = await message.answer(
-                    f"Код истёк. Отправить новый код на {user.email}?",
-                    reply_markup=kb_auth_code_wait(),
-                )
-                await state.update_data(last_kb_mid=sent.message_id)
-                return
-
-            if used_at:
-                await session.commit()
-                sent = await message.answer(
-                    "Код уже был использован. Запросите новый.",
-                    reply_markup=kb_auth_code_wait(),
+        # в БД хранится хеш кода; сравнение хешей за постоянное время
+        if not hmac.compare_digest(hash_otp(code, settings.otp_pepper), otp_row.code):
+            user.otp_attempts += 1
+            user.stage = "verifying_code"
+            if user.otp_attempts > settings.otp_max_attempts:
+                user.status = "blocked"
+                # заблокированному отвечаем о блокировке, а не о cooldown
+                _OTP_LAST_SENT.pop(user.telegram_id, None)
+                user.stage = "verifying_code_error"
+                notice = await _log_block_request(
+                    session,
+                    settings,
+                    user,
+                    "Слишком много неверных OTP-кодов",
+                    "otp",
+                    message.from_user.full_name,
                 )
-                await state.update_data(last_kb_mid=sent.message_id)
-                return
-
-            if code != otp_row.code:
-                user.otp_attempts += 1
-                user.stage = "verifying_code"
-                if user.otp_attempts > settings.otp_max_attempts:
-                    user.status = "blocked"
-                    user.stage = "verifying_code_error"
-                    await _notify_admin_on_block(
-                        session,
-                        settings,
-                        user,
-                        "Слишком много неверных OTP-кодов",
-                        "otp",
-                        message.bot,
-                        message.from_user.full_name,
-                    )
-                    await session.commit()
-                    await message.answer(
-                        "Слишком много неверных попыток. Доступ заблокирован, администратор уведомлён, ожидайте решения."
-                    )
-                    return
-                await session.commit()
-                sent = await message.answer(
-                    f"Неверный код. Попробуйте ещё раз или запросите новый.\nПопыток осталось: {settings.otp_max_attempts - user.otp_attempts + 1}",
-                    reply_markup=kb_auth_code_wait(),
+                return (
+                    "Слишком много неверных попыток. Доступ заблокирован, администратор уведомлён, ожидайте решения.",
+                    None,
+                    notice,
                 )
-                await state.update_data(last_kb_mid=sent.message_id)
-                return
-
-            # УСПЕХ: показать «Анкета 🪪»
-            otp_row.used_at = now
-            user.status = "active"
-            user.stage = "authorized"
-            user.email_attempts = 0
-            user.otp_attempts = 0
-            await session.commit()
-            sent = await message.answer(
-                "Успешная авторизация! ✅", reply_markup=kb_start_authorized()
+            return (
+                f"Неверный код. Попробуйте ещё раз или запросите новый.\nПопыток осталось: {settings.otp_max_attempts - user.otp_attempts + 1}",
+                kb_auth_code_wait(),
+                None,
             )
-            await state.update_data(last_kb_mid=sent.message_id)
-            return
 
-        await session.commit()
-        return
+        # УСПЕХ: показать «Анкета 🪪»
+        otp_row.used_at = now
+        _OTP_LAST_SENT.pop(user.telegram_id, None)
+        user.status = "active"
+        user.stage = "authorized"
+        user.email_attempts = 0
+        user.otp_attempts = 0
+        return "Успешная авторизация! ✅", kb_start_authorized(), None
+
+    return None, None, None
 
 
 # ------------------------ callbacks: resend/change -------------- #
@@ -420,6 +586,11 @@ async def cb_otp_resend(
     session_factory: async_sessionmaker[AsyncSession],
     settings: Settings,
 ) -> None:
+    # код недавно ушёл из этого процесса — отказываем без обращения к БД, кнопки оставляем
+    if _in_otp_cooldown(cq.from_user.id, settings):
+        await cq.answer(_COOLDOWN_WARN)
+        return
+
     # гасим текущие кнопки в сообщении с которым работаем
     try:
         await cq.message.edit_reply_markup(reply_markup=None)
@@ -428,7 +599,7 @@ async def cb_otp_resend(
 
     async with session_factory() as session:
         user = await _user(session, cq.from_user.id)
-        user.last_activity = now_utc()
+        touch(user.telegram_id)
 
         if user.status == "blocked":
             await session.commit()
@@ -443,8 +614,9 @@ async def cb_otp_resend(
             await cq.answer("Не требуется переотправка.")
             return
 
-        ok, warn = await _send_or_resend_otp(session, settings, user)
+        ok, warn = await _send_or_resend_otp(session, settings, user, now_utc())
         await session.commit()
+        _remember_otp_sent(session)
         await cq.message.answer(
             ("Код отправлен повторно." if ok else "Не удалось отправить код.")
             + (f"\n⚠️ {warn}" if warn else "")
@@ -469,7 +641,7 @@ async def cb_change_email(
 
     async with session_factory() as session:
         user = await _user(session, cq.from_user.id)
-        user.last_activity = now_utc()
+        touch(user.telegram_id)
 
         if user.status == "blocked":
             await session.commit()
@@ -481,6 +653,7 @@ async def cb_change_email(
 
         user.stage = "verifying_email"
         await session.commit()
+        await state.set_state(AuthStates.verifying_email)
         await cq.message.answer("Отправьте новый корпоративный e-mail:")
         await state.update_data(last_kb_mid=None)
         await cq.answer()
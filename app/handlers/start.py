@@ -7,36 +7,30 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timezone
-
 from aiogram import Router
 from aiogram.filters import CommandStart
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 
-from sqlalchemy import select
+from sqlalchemy import bindparam, select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import undefer_group
 
 from ..config import Settings
 from ..keyboards import kb_start_authorized, kb_profile_filled, kb_auth_code_wait
-from ..models import User
-from ..logger import setup_logging
+from ..models import PROFILE_BLOB, User
+from ..states import AuthStates, stage_state
+from ..utils.activity import touch
+from ..utils.kb import clear_last_kb
 
 router = Router()
-setup_logging()
-
 
-async def _clear_last_kb(state: FSMContext, chat_id: int, bot) -> None:
-    data = await state.get_data()
-    mid = data.get("last_kb_mid")
-    if mid:
-        try:
-            await bot.edit_message_reply_markup(
-                chat_id=chat_id, message_id=mid, reply_markup=None
-            )
-        except Exception:
-            pass
-        await state.update_data(last_kb_mid=None)
+# /start может показать предпросмотр анкеты — JSON-колонки грузим сразу
+_SEL_USER = (
+    select(User)
+    .options(undefer_group(PROFILE_BLOB))
+    .where(User.telegram_id == bindparam("tg_id"))
+)
 
 
 @router.message(CommandStart())
@@ -51,10 +45,10 @@ async def cmd_start(
         user = await _get_or_create_user(
             session, message.from_user.id, message.from_user.username
         )
-        user.last_activity = datetime.now(timezone.utc)
+        touch(user.telegram_id)
 
         # гасим старые кнопки, если есть
-        await _clear_last_kb(state, message.chat.id, message.bot)
+        await clear_last_kb(state, message.chat.id, message.bot)
 
         if user.status == "blocked":
             await session.commit()
@@ -67,12 +61,16 @@ async def cmd_start(
         if user.stage in {"new", "verifying_email", "verifying_email_error"}:
             user.stage = "verifying_email"
             await session.commit()
+            await state.set_state(AuthStates.verifying_email)
             await message.answer(
                 "Привет! Давайте зарегистрируемся через корпоративную почту.\n"
                 "Отправьте адрес (например, name@corp.com):"
             )
             return
 
+        # /start — точка пересинхронизации: состояние FSM по стадии из БД
+        await state.set_state(stage_state(user.stage))
+
         # ожидание OTP — показываем кнопки переотправки/смены почты
         if user.stage in {"verifying_code", "verifying_code_error"}:
             await session.commit()
@@ -101,9 +99,16 @@ async def cmd_start(
             # import helper to use same preview logic
             from .profile import _send_profile_preview_with_photos
 
+            fsm: dict = {}
             await _send_profile_preview_with_photos(
-                message.bot, message.chat.id, user, state, kb_profile_filled()
+                message.bot,
+                message.chat.id,
+                user,
+                kb_profile_filled(),
+                await state.get_data(),
+                fsm,
             )
+            await state.update_data(**fsm)
             return
 
         if user.stage in {
@@ -144,7 +149,7 @@ def _profile_preview_text(user: User) -> str:
 async def _get_or_create_user(
     session: AsyncSession, tg_id: int, username: str | None
 ) -> User:
-    res = await session.execute(select(User).where(User.telegram_id == tg_id))
+    res = await session.execute(_SEL_USER, {"tg_id": tg_id})
     user = res.scalar_one_or_none()
     if user:
         if username and user.username != username:
@@ -4,13 +4,18 @@
 - авторизация (resend / change email),
 - анкета (предпросмотр/сохранение/редактирование),
 - админка (блок/разблок).
+Клавиатуры неизменяемые, поэтому каждая собирается один раз (lru_cache) и
+переиспользуется — без валидации pydantic-моделей на каждое сообщение.
 """
 
 from __future__ import annotations
 
+from functools import lru_cache
+
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 
+@lru_cache(maxsize=1)
 def kb_auth_code_wait() -> InlineKeyboardMarkup:
     """Кнопки в стадии ввода кода OTP."""
     return InlineKeyboardMarkup(
@@ -29,6 +34,7 @@ def kb_auth_code_wait() -> InlineKeyboardMarkup:
     )
 
 
+@lru_cache(maxsize=1)
 def kb_start_authorized() -> InlineKeyboardMarkup:
     """Кнопка перехода к анкете после успешной авторизации."""
     return InlineKeyboardMarkup(
@@ -38,6 +44,7 @@ def kb_start_authorized() -> InlineKeyboardMarkup:
     )
 
 
+@lru_cache(maxsize=1)
 def kb_profile_filled() -> InlineKeyboardMarkup:
     """Кнопки после сохранения анкеты."""
     return InlineKeyboardMarkup(
@@ -56,6 +63,7 @@ def kb_profile_filled() -> InlineKeyboardMarkup:
     )
 
 
+@lru_cache(maxsize=1)
 def kb_profile_photo() -> InlineKeyboardMarkup:
     """Кнопки на шаге фотографий."""
     return InlineKeyboardMarkup(
@@ -74,6 +82,7 @@ def kb_profile_photo() -> InlineKeyboardMarkup:
     )
 
 
+@lru_cache(maxsize=1)
 def kb_prefilled_data() -> InlineKeyboardMarkup:
     """Кнопки для подтверждения предзаполненного значения из импорта."""
     return InlineKeyboardMarkup(
@@ -92,6 +101,7 @@ def kb_prefilled_data() -> InlineKeyboardMarkup:
     )
 
 
+@lru_cache(maxsize=1)
 def kb_profile_review() -> InlineKeyboardMarkup:
     """Кнопки предпросмотра анкеты."""
     return InlineKeyboardMarkup(
@@ -122,6 +132,7 @@ def kb_profile_review() -> InlineKeyboardMarkup:
     )
 
 
+@lru_cache(maxsize=1024)
 def kb_admin_decision(user_id: int) -> InlineKeyboardMarkup:
     """Кнопки для заявки админам (блок/разблок)."""
     return InlineKeyboardMarkup(
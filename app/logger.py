@@ -6,15 +6,23 @@
 from __future__ import annotations
 
 import logging
+import sys
+
+_FMT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+
+_configured = False
 
 
 def setup_logging(level: str = "INFO") -> None:
-    """Настраивает консольный логгер."""
+    """Настраивает консольный логгер; повторные вызовы ничего не делают."""
+    global _configured
+    if _configured:
+        return
+    _configured = True
     root = logging.getLogger()
     if root.handlers:
         return
     root.setLevel(level.upper())
-    handler = logging.StreamHandler()
-    fmt = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
-    handler.setFormatter(logging.Formatter(fmt))
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(_FMT))
     root.addHandler(handler)
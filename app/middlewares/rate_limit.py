@@ -0,0 +1,106 @@
+# app/middlewares/rate_limit.py
+"""
+Мидлварь исходящих запросов к Bot API: token bucket под лимиты Telegram
+(~30 сообщений/с на бота, ~1/с в один чат с небольшим всплеском).
+Ограничиваются только запросы с chat_id; answerCallbackQuery, getUpdates и т.п.
+идут без очереди. На 429 (TelegramRetryAfter) ждём retry_after и повторяем.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket без блокировок: токен резервируется сразу, ожидание — sleep."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Забирает токен и возвращает, сколько секунд подождать до его появления."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Ограничивает частоту исходящих запросов глобально и по чатам."""
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        max_retries: int = 2,
+        max_chats: int = 10_000,
+    ) -> None:
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chats: dict[int | str, TokenBucket] = {}
+        self._max_retries = max_retries
+        self._max_chats = max_chats
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self._max_chats:
+                self._chats.clear()
+            bucket = self._chats[chat_id] = TokenBucket(
+                self._chat_rate, self._chat_burst
+            )
+        return bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        attempt = 0
+        while True:
+            await self._chat_bucket(chat_id).acquire()
+            await self._global.acquire()
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self._max_retries:
+                    raise
+                logger.warning(
+                    "Flood control: %s в чате %s, повтор через %s с",
+                    type(method).__name__,
+                    chat_id,
+                    e.retry_after,
+                )
+                await asyncio.sleep(e.retry_after)
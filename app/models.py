@@ -8,22 +8,31 @@
 - auth_attempts: последние введённые значения (email/otp) для заявок админам.
 - roles, user_roles: доступ к админ-панели по ролям.
 - admin_log: журнал действий админ-панели.
+
+JSON-колонки на PostgreSQL хранятся как jsonb (бинарный формат без повторного
+разбора текста при чтении), на SQLite — обычный JSON. Существующую БД (индексы,
+ограничения, jsonb) приводит к этим моделям scripts/upgrade_db.py.
 """
 
 from __future__ import annotations
 
+import sys
 from datetime import datetime
 from typing import Optional
 
 from sqlalchemy import (
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     JSON,
     String,
+    TypeDecorator,
     UniqueConstraint,
     func,
+    text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -31,6 +40,28 @@ class Base(DeclarativeBase):
     """Базовый класс декларативных моделей."""
 
 
+# JSON для SQLite, jsonb для PostgreSQL
+_JSON = JSON().with_variant(JSONB(), "postgresql")
+
+
+class InternedStr(TypeDecorator):
+    """
+    Строка из небольшого набора значений (статусы, стадии, типы): прочитанные
+    значения интернируются — строки всех загруженных строк делят один объект.
+    """
+
+    impl = String
+    cache_ok = True
+
+    def process_result_value(self, value, dialect):
+        return sys.intern(value) if value else value
+
+
+# Группа отложенных JSON-колонок анкеты/импорта: обычный SELECT по users их не
+# тянет и не разбирает; где они нужны — options(undefer_group(PROFILE_BLOB))
+PROFILE_BLOB = "profile_blob"
+
+
 # ----------------------------- Users ----------------------------- #
 
 
@@ -45,33 +76,34 @@ class User(Base):
 
     # Текущий статус/стадия
     status: Mapped[str] = mapped_column(
-        String(16), default="new", index=True
+        InternedStr(16), default="new"
     )  # new/active/blocked/imported
-    stage: Mapped[str] = mapped_column(String(32), default="new", index=True)
+    stage: Mapped[str] = mapped_column(InternedStr(32), default="new")
 
     # Авторизация через e-mail
-    email: Mapped[Optional[str]] = mapped_column(
-        String(255), unique=True, nullable=True
-    )
+    # уникальность без учёта регистра — индекс uq_users_email_lower (ниже)
+    email: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     email_attempts: Mapped[int] = mapped_column(Integer, default=0)
     otp_attempts: Mapped[int] = mapped_column(Integer, default=0)
 
     # Анкета
     name: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
     photos_json: Mapped[Optional[dict]] = mapped_column(
-        JSON, nullable=True
-    )  # {"photos": [{"file_id":..., "ts":...}, ...]}
+        _JSON, nullable=True, deferred=True, deferred_group=PROFILE_BLOB
+    )  # {"photos": [{"file_id":..., "ts": epoch-секунды}, ...]}
     bio: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
     age: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     interests_json: Mapped[Optional[dict]] = mapped_column(
-        JSON, nullable=True
+        _JSON, nullable=True, deferred=True, deferred_group=PROFILE_BLOB
     )  # {"interests": [...]}
 
     # Импорт
     origin: Mapped[Optional[str]] = mapped_column(
-        String(16), nullable=True
+        InternedStr(16), nullable=True
     )  # 'import' | 'self'
-    import_payload: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    import_payload: Mapped[Optional[dict]] = mapped_column(
+        _JSON, nullable=True, deferred=True, deferred_group=PROFILE_BLOB
+    )
 
     # Аудит
     last_activity: Mapped[datetime] = mapped_column(
@@ -88,6 +120,16 @@ class User(Base):
         back_populates="user", cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        # выборки по статусу и стадии (например, «активные с заполненной анкетой»):
+        # один составной индекс вместо двух одиночных, которые правились на каждой смене стадии
+        Index("ix_users_status_stage", "status", "stage"),
+    )
+
+
+# адрес хранится как введён; уникален и ищется по lower(email)
+Index("uq_users_email_lower", func.lower(User.email), unique=True)
+
 
 # ------------------------------ OTP ------------------------------ #
 
@@ -98,11 +140,11 @@ class Otp(Base):
     __tablename__ = "otp"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    user_id: Mapped[int] = mapped_column(
-        ForeignKey("users.id", ondelete="CASCADE"), index=True
-    )
+    # отдельный индекс не нужен: user_id — ведущая колонка ix_otp_user_created
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
 
-    code: Mapped[str] = mapped_column(String(12))
+    # hash_otp(код): BLAKE2b-128 hex, открытый код не хранится
+    code: Mapped[str] = mapped_column(String(64))
     session_id: Mapped[str] = mapped_column(
         String(32), index=True
     )  # логическая «сессия» для контроля resend
@@ -114,7 +156,7 @@ class Otp(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
-    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
     used_at: Mapped[Optional[datetime]] = mapped_column(
         DateTime(timezone=True), nullable=True
     )
@@ -123,6 +165,15 @@ class Otp(Base):
 
     __table_args__ = (
         UniqueConstraint("user_id", "session_id", name="uq_otp_user_session"),
+        # последний код пользователя: один спуск по индексу (ORDER BY created_at DESC LIMIT 1)
+        Index("ix_otp_user_created", "user_id", "created_at"),
+        # очистка просроченных: частичный индекс только по неиспользованным кодам
+        Index(
+            "ix_otp_live",
+            "expires_at",
+            postgresql_where=text("used_at IS NULL"),
+            sqlite_where=text("used_at IS NULL"),
+        ),
     )
 
 
@@ -139,7 +190,7 @@ class AuthAttempt(Base):
         ForeignKey("users.id", ondelete="CASCADE"), index=True
     )
 
-    type: Mapped[str] = mapped_column(String(16))  # "email" | "otp"
+    type: Mapped[str] = mapped_column(InternedStr(16))  # "email" | "otp"
     value: Mapped[str] = mapped_column(String(255))
     ts: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), index=True
@@ -157,7 +208,7 @@ class Role(Base):
     __tablename__ = "roles"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(32), unique=True, index=True)
+    name: Mapped[str] = mapped_column(InternedStr(32), unique=True, index=True)
 
 
 class UserRole(Base):
@@ -176,6 +227,10 @@ class UserRole(Base):
     user: Mapped["User"] = relationship(back_populates="roles")
     role: Mapped["Role"] = relationship()
 
+    __table_args__ = (
+        UniqueConstraint("user_id", "role_id", name="uq_user_roles_user_role"),
+    )
+
 
 # --------------------------- Admin log --------------------------- #
 
@@ -187,8 +242,9 @@ class AdminLog(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     admin_telegram_id: Mapped[int] = mapped_column(Integer, index=True)
-    action: Mapped[str] = mapped_column(String(64))
-    payload: Mapped[dict] = mapped_column(JSON)
+    action: Mapped[str] = mapped_column(InternedStr(64))
+    # пишется, но в рабочих запросах не читается
+    payload: Mapped[dict] = mapped_column(_JSON, deferred=True)
     ts: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
@@ -27,3 +27,21 @@ class ProfileStates(StatesGroup):
     profile_interests = State()
     profile_review = State()
     profile_filled = State()
+
+
+# users.stage → состояние FSM (имена состояний совпадают со стадиями)
+_PROFILE_STATES = {s.state.split(":", 1)[1]: s for s in ProfileStates.__all_states__}
+_STAGE_STATES = {
+    **{s.state.split(":", 1)[1]: s for s in AuthStates.__all_states__},
+    **_PROFILE_STATES,
+}
+
+
+def profile_state(stage: str) -> State | None:
+    """Состояние FSM для стадии анкеты; None — стадия не относится к анкете."""
+    return _PROFILE_STATES.get(stage)
+
+
+def stage_state(stage: str) -> State | None:
+    """Состояние FSM для любой стадии; None — для стадии нет состояния (например, new)."""
+    return _STAGE_STATES.get(stage)
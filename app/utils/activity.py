@@ -0,0 +1,79 @@
+# app/utils/activity.py
+"""
+Отложенная запись users.last_activity (write-behind).
+Хендлеры только отмечают активность (touch), а фоновая задача раз в _FLUSH_INTERVAL
+секунд пишет накопленное одним executemany — без лишнего UPDATE на каждый апдейт.
+Отметки одного пользователя чаще раза в _DEBOUNCE секунд отбрасываются: активный
+пользователь попадает в пачку не на каждом сбросе, а last_activity точна до _DEBOUNCE.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ..models import User
+from .dt import now_utc
+
+logger = logging.getLogger(__name__)
+
+_FLUSH_INTERVAL = 10.0
+_DEBOUNCE = 30.0
+
+# telegram_id -> time.monotonic() последней принятой отметки
+_LAST_TOUCH: dict[int, float] = {}
+_LAST_TOUCH_MAX = 50_000
+
+# telegram_id -> время последней активности, ещё не записанное в БД
+_PENDING: dict[int, datetime] = {}
+
+_users = User.__table__
+_UPDATE_ACTIVITY = (
+    update(_users)
+    .where(_users.c.telegram_id == bindparam("b_tg_id"))
+    .values(last_activity=bindparam("b_ts"))
+)
+
+
+def touch(tg_id: int, now: datetime | None = None) -> None:
+    """
+    Отмечает активность пользователя; в БД попадёт при ближайшем сбросе.
+    now — уже взятое хендлером текущее время, чтобы не читать часы повторно.
+    """
+    mono = time.monotonic()
+    last = _LAST_TOUCH.get(tg_id)
+    if last is not None and mono - last < _DEBOUNCE:
+        return
+    if len(_LAST_TOUCH) >= _LAST_TOUCH_MAX:
+        _LAST_TOUCH.clear()
+    _LAST_TOUCH[tg_id] = mono
+    _PENDING[tg_id] = now or now_utc()
+
+
+async def flush(session_factory: async_sessionmaker[AsyncSession]) -> None:
+    """Пишет накопленную активность одним запросом."""
+    if not _PENDING:
+        return
+    batch = [{"b_tg_id": tg_id, "b_ts": ts} for tg_id, ts in _PENDING.items()]
+    _PENDING.clear()
+    async with session_factory() as session:
+        await session.execute(_UPDATE_ACTIVITY, batch)
+        await session.commit()
+
+
+async def run_flusher(session_factory: async_sessionmaker[AsyncSession]) -> None:
+    """Фоновый цикл сброса; при отмене (остановка бота) дописывает остаток."""
+    try:
+        while True:
+            await asyncio.sleep(_FLUSH_INTERVAL)
+            try:
+                await flush(session_factory)
+            except Exception:
+                logger.exception("Не удалось записать last_activity")
+    finally:
+        await flush(session_factory)
@@ -0,0 +1,35 @@
+# app/utils/background.py
+"""
+Фоновые задачи «запустил и забыл» (уведомления, косметические правки сообщений).
+Храним ссылки на задачи, чтобы их не собрал GC, и дожидаемся незавершённых при остановке.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Coroutine
+
+logger = logging.getLogger(__name__)
+
+_tasks: set[asyncio.Task] = set()
+
+
+def spawn(coro: Coroutine[Any, Any, Any]) -> asyncio.Task:
+    """Запускает корутину в фоне; необработанные исключения пишем в лог."""
+    task = asyncio.create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_on_done)
+    return task
+
+
+def _on_done(task: asyncio.Task) -> None:
+    _tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Фоновая задача завершилась с ошибкой", exc_info=task.exception())
+
+
+async def drain(timeout: float = 10.0) -> None:
+    """Дожидается незавершённых фоновых задач (хук остановки бота)."""
+    if _tasks:
+        await asyncio.wait(set(_tasks), timeout=timeout)
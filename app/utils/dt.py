@@ -8,12 +8,15 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 
+# Синглтон таймзоны UTC: без поиска атрибута timezone.utc на каждом вызове
+UTC = timezone.utc
+
 
 def now_utc() -> datetime:
     """
     Текущее время в UTC со встроенной таймзоной (aware).
     """
-    return datetime.now(timezone.utc)
+    return datetime.now(UTC)
 
 
 def ensure_aware_utc(dt: datetime | None) -> datetime | None:
@@ -21,11 +24,15 @@ def ensure_aware_utc(dt: datetime | None) -> datetime | None:
     Приводит datetime к aware-UTC:
     - если dt is None — вернуть None;
     - если naive (tzinfo is None) — просто присвоить tz UTC;
-    - если aware — сконвертировать в UTC.
+    - если aware — сконвертировать в UTC (уже UTC — вернуть как есть, без копии).
     """
     if dt is None:
         return None
-    if dt.tzinfo is None:
+    tz = dt.tzinfo
+    if tz is UTC:
+        # asyncpg отдаёт timestamptz уже в timezone.utc — самый частый случай
+        return dt
+    if tz is None:
         # Считаем, что «наивное» время — это UTC в нашей системе.
-        return dt.replace(tzinfo=timezone.utc)
-    return dt.astimezone(timezone.utc)
+        return dt.replace(tzinfo=UTC)
+    return dt.astimezone(UTC)
@@ -2,24 +2,126 @@
 """
 Отправка OTP-писем через SMTP (TLS), по параметрам из конфигурации.
 Не логируем тело/код письма, только статус доставки.
+Соединения с SMTP-сервером переиспользуются между письмами (STARTTLS и логин —
+один раз), простаивающее дольше _MAX_IDLE секунд закрывается перед следующей отправкой.
+
+Письмо отправляется внутри транзакции БД хендлера регистрации, поэтому соединения
+собраны в пул из _POOL_SIZE слотов со своими замками: медленный или зависший сервер
+(до 20 с на команду, с переподключением — вдвое дольше) задерживает только письма
+своего слота. Если заняты все слоты, следующее письмо ждёт, держа транзакцию, —
+это цена ограничения числа одновременных SMTP-сессий.
 """
 
 from __future__ import annotations
 
+import asyncio
+import itertools
+import ssl
+import time
 from email.message import EmailMessage
 
 import aiosmtplib
 
 from ..config import Settings
 
+# соединение живёт, пока между письмами проходит не больше _MAX_IDLE секунд:
+# дольше его всё равно может закрыть сервер по своему таймауту
+_MAX_IDLE = 60.0
+
+# TLS-контекст с принудительным TLS 1.2+: CA-бандл системы разбирается один раз
+_TLS_CONTEXT = ssl.create_default_context()
+_TLS_CONTEXT.minimum_version = ssl.TLSVersion.TLSv1_2
+
+# одно соединение — одна SMTP-транзакция за раз, поэтому держим небольшой пул:
+# письма уходят параллельно, пока свободен хотя бы один из _POOL_SIZE слотов
+_POOL_SIZE = 4
+
+
+class _Slot:
+    """Слот пула: своё соединение и свой замок, его сериализующий."""
+
+    __slots__ = ("client", "key", "last_used", "lock")
+
+    def __init__(self) -> None:
+        self.client: aiosmtplib.SMTP | None = None
+        self.key: tuple | None = None
+        self.last_used = 0.0
+        self.lock = asyncio.Lock()
+
+    def drop(self) -> None:
+        """Бросает соединение без QUIT: оно простаивало или в неизвестном состоянии."""
+        if self.client is not None:
+            self.client.close()
+        self.client = self.key = None
+
+    async def get_client(self, settings: Settings) -> aiosmtplib.SMTP:
+        """Живое соединение для settings: переиспользуем или открываем заново."""
+        key = _smtp_key(settings)
+        if self.client is not None and (
+            not self.client.is_connected
+            or self.key != key
+            or time.monotonic() - self.last_used > _MAX_IDLE
+        ):
+            self.drop()
+        if self.client is None:
+            self.client = await _connect(settings)
+            self.key = key
+        return self.client
+
+
+_pool = [_Slot() for _ in range(_POOL_SIZE)]
+_next_slot = itertools.count()
+
+
+def _smtp_key(settings: Settings) -> tuple:
+    return (
+        settings.smtp_host,
+        settings.smtp_port,
+        settings.smtp_user,
+        settings.smtp_password,
+    )
+
+
+async def _connect(settings: Settings) -> aiosmtplib.SMTP:
+    """Новое соединение: TCP + STARTTLS (TLS 1.2+) + логин."""
+    client = aiosmtplib.SMTP(
+        hostname=settings.smtp_host,
+        port=settings.smtp_port,
+        start_tls=True,
+        tls_context=_TLS_CONTEXT,
+        username=settings.smtp_user,
+        password=settings.smtp_password,
+        timeout=20,
+    )
+    await client.connect()
+    return client
+
+
+def _checkout() -> _Slot:
+    """Свободный слот, а если заняты все — следующий по кругу (ждём его замок)."""
+    for slot in _pool:
+        if not slot.lock.locked():
+            return slot
+    return _pool[next(_next_slot) % _POOL_SIZE]
+
+
+async def close_smtp() -> None:
+    """Закрывает SMTP-соединения пула (хук остановки бота)."""
+    for slot in _pool:
+        async with slot.lock:
+            if slot.client is not None and slot.client.is_connected:
+                try:
+                    await slot.client.quit()
+                except aiosmtplib.SMTPException:
+                    pass
+            slot.drop()
+
 
 async def send_otp_email(settings: Settings, to_email: str, otp_code: str) -> None:
     """
     Отправляет проверочный код на e-mail по TLS 1.2+.
     Ошибки отдаём наверх — пусть ловятся на уровне хендлеров.
     """
-    import ssl
-
     msg = EmailMessage()
     msg["From"] = settings.smtp_from
     msg["To"] = to_email
@@ -30,17 +132,17 @@ async def send_otp_email(settings: Settings, to_email: str, otp_code: str) -> No
         "Если вы не запрашивали код — просто игнорируйте это письмо."
     )
 
-    # Создаём TLS-контекст с принудительным TLS 1.2+
-    ctx = ssl.create_default_context()
-    ctx.minimum_version = ssl.TLSVersion.TLSv1_2
-
-    await aiosmtplib.send(
-        msg,
-        hostname=settings.smtp_host,
-        port=settings.smtp_port,
-        start_tls=True,
-        tls_context=ctx,  # Используем созданный контекст
-        username=settings.smtp_user,
-        password=settings.smtp_password,
-        timeout=20,
-    )
+    slot = _checkout()
+    async with slot.lock:
+        try:
+            try:
+                await (await slot.get_client(settings)).send_message(msg)
+            except aiosmtplib.SMTPServerDisconnected:
+                # сервер закрыл соединение между письмами — одна попытка на новом
+                slot.drop()
+                await (await slot.get_client(settings)).send_message(msg)
+        except BaseException:
+            # состояние SMTP-транзакции неизвестно — соединение не переиспользуем
+            slot.drop()
+            raise
+        slot.last_used = time.monotonic()
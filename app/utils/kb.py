@@ -0,0 +1,39 @@
+# app/utils/kb.py
+"""
+Снятие инлайн-кнопок со старых сообщений бота.
+ID последнего сообщения с кнопками хранится в FSM (last_kb_mid); сами правки
+сообщений идут в фоне — хендлер их не ждёт, ошибки Telegram не важны.
+"""
+
+from __future__ import annotations
+
+from aiogram.fsm.context import FSMContext
+
+from .background import spawn
+
+
+async def drop_kb(message) -> None:
+    """Снимает кнопки у сообщения; запускается в фоне, ошибки не важны."""
+    try:
+        await message.edit_reply_markup(reply_markup=None)
+    except Exception:
+        pass
+
+
+async def drop_kb_by_id(bot, chat_id: int, message_id: int) -> None:
+    try:
+        await bot.edit_message_reply_markup(
+            chat_id=chat_id, message_id=message_id, reply_markup=None
+        )
+    except Exception:
+        pass
+
+
+async def clear_last_kb(state: FSMContext, chat_id: int, bot) -> None:
+    """Снимает клавиатуру у последнего нашего сообщения, если оно есть."""
+    # сам запрос к Telegram не ждём — он идёт параллельно с работой хендлера
+    data = await state.get_data()
+    mid = data.get("last_kb_mid")
+    if mid:
+        spawn(drop_kb_by_id(bot, chat_id, mid))
+        await state.update_data(last_kb_mid=None)
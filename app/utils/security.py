@@ -1,50 +1,124 @@
 # app/utils/security.py
 """
-Утилиты безопасности: генерация OTP, валидация e-mail, бан-слова, нормализация интересов.
+Утилиты безопасности: генерация и хеширование OTP, валидация e-mail, бан-слова, нормализация интересов.
 """
 
 from __future__ import annotations
 
+import hashlib
 import secrets
 import re
-from typing import Iterable, List
+from functools import lru_cache
+from typing import Callable, Iterable, List
+
+try:  # опционально: автомат Ахо–Корасик (pyahocorasick), иначе — общий regex
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+from ..config import Settings
+
+# Максимальная длина адреса по RFC 5321; длиннее — не гоняем через regex
+_EMAIL_MAX_LEN = 254
+
+# Разделители интересов: запятая, точка с запятой, перевод строки
+_SPLIT_RE = re.compile(r"[,\n;]+")
+# Верхняя граница ввода интересов: 30 пунктов по 50 символов с разделителями
+# укладываются в ~1560 символов; длиннее — отказ до разбора
+_INTERESTS_RAW_MAX = 2000
 
 
 def generate_otp(length: int = 6) -> str:
-    """Генерирует криптографически стойкий OTP-код фиксированной длины."""
-    return "".join(secrets.choice("0123456789") for _ in range(length))
+    """Генерирует криптографически стойкий OTP-код фиксированной длины (с ведущими нулями)."""
+    return str(secrets.randbelow(10**length)).zfill(length)
 
 
-def validate_email(
-    email: str, regex: re.Pattern[str], allowed_domains: set[str]
-) -> tuple[bool, str | None]:
+def hash_otp(code: str, pepper: bytes) -> str:
+    """
+    Хеш OTP-кода для хранения в БД: BLAKE2b-128 с ключом (pepper).
+    Открытый код в БД не попадает; сравнивать хеши — через hmac.compare_digest.
+    """
+    return hashlib.blake2b(code.encode(), digest_size=16, key=pepper).hexdigest()
+
+
+def validate_email(email: str, settings: Settings) -> tuple[bool, str | None]:
     """
     Валидация e-mail:
-    - соответствие regex;
-    - домен входит в ALLOWED_DOMAINS (если задан).
+    - длина не больше 254 символов;
+    - соответствие settings.email_regex (скомпилирован при загрузке);
+    - домен входит в ALLOWED_DOMAINS (если задан; домены уже в нижнем регистре).
     """
-    if not regex.match(email):
+    if len(email) > _EMAIL_MAX_LEN or not settings.email_regex.match(email):
         return False, "Некорректный формат e‑mail."
-    if allowed_domains:
-        try:
-            domain = email.split("@", 1)[1].lower()
-        except Exception:
+    if settings.allowed_domains:
+        # домен — после последнего «@»; rpartition не строит список, как split
+        _, at, domain = email.rpartition("@")
+        if not at:
             return False, "Некорректный формат e‑mail."
-        if domain not in {d.lower() for d in allowed_domains}:
+        # адреса обычно вводят в нижнем регистре: lower() — только если домен не нашёлся как есть
+        allowed = settings.allowed_domains
+        if domain not in allowed and (domain := domain.lower()) not in allowed:
             return False, f"Домен @{domain} не разрешён."
     return True, None
 
 
+@lru_cache(maxsize=8)
+def _banned_matcher(words: frozenset[str]) -> Callable[[str], str | None]:
+    """
+    Собирает поиск бан-слов один раз на набор: проход по тексту линейный
+    и не зависит от размера словаря. Принимает текст в нижнем регистре,
+    возвращает найденное слово или None.
+    """
+    if not words:
+        return lambda low: None
+
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for w in words:
+            automaton.add_word(w, w)
+        automaton.make_automaton()
+
+        def find(low: str) -> str | None:
+            for _, w in automaton.iter(low):
+                return w
+            return None
+
+        return find
+
+    pattern = re.compile("|".join(map(re.escape, sorted(words, key=len, reverse=True))))
+
+    def find(low: str) -> str | None:
+        m = pattern.search(low)
+        return m.group() if m else None
+
+    return find
+
+
+def _banned_finder(banned_words: Iterable[str]) -> Callable[[str], str | None]:
+    """
+    Поиск бан-слов для набора banned_words: текст в нижнем регистре -> слово или None.
+    Набор нормализуется (strip/lower) здесь, если это ещё не frozenset из Settings.
+    """
+    if not isinstance(banned_words, frozenset):
+        banned_words = frozenset(w.strip().lower() for w in banned_words) - {""}
+    matcher = _banned_matcher(banned_words)
+
+    def find(low: str) -> str | None:
+        # текст целиком совпал со словом — без прохода автомата
+        return low if low in banned_words else matcher(low)
+
+    return find
+
+
 def contains_banned_words(
     text: str, banned_words: Iterable[str]
 ) -> tuple[bool, str | None]:
-    """Проверка наличия бан-слов (без учёта регистра), возвращает (есть_запрет, слово)."""
-    low = text.lower()
-    for w in banned_words:
-        w = w.strip().lower()
-        if w and w in low:
-            return True, w
-    return False, None
+    """
+    Проверка наличия бан-слов (без учёта регистра), возвращает (есть_запрет, слово).
+    Лучше передавать settings.banned_words_set: он уже нормализован и не пересобирается.
+    """
+    w = _banned_finder(banned_words)(text.lower())
+    return (True, w) if w else (False, None)
 
 
 def normalize_interests(
@@ -57,27 +131,35 @@ def normalize_interests(
     - проверяет длину (каждый пункт 1..50 символов);
     - убирает дубли (без учёта регистра);
     - фильтрует бан-слова.
+    Слишком длинный ввод (> _INTERESTS_RAW_MAX) отклоняется сразу, без разбора.
     """
-    if not raw.strip():
-        return [], None
-    parts = re.split(r"[,\n;]+", raw)
-    interests = [p.strip() for p in parts if p.strip()]
-    if len(interests) > 30:
-        return None, "Слишком много значений (макс. 30)."
-    for interest in interests:
-        if not (1 <= len(interest) <= 50):
+    if len(raw) > _INTERESTS_RAW_MAX:
+        return None, "Слишком длинный ввод."
+    # поиск собирается один раз на вызов, а не на каждый интерес
+    find_banned = _banned_finder(banned_words)
+    # один проход: разбор, проверки, дедупликация и подсчёт длины
+    seen: set[str] = set()
+    result: List[str] = []
+    count = total = 0
+    for part in _SPLIT_RE.split(raw):
+        interest = part.strip()
+        if not interest:
+            continue
+        count += 1
+        if count > 30:
+            return None, "Слишком много значений (макс. 30)."
+        key = interest.lower()
+        # дубль (без учёта регистра) уже проверен и учтён
+        if key in seen:
+            continue
+        n = len(interest)
+        if n > 50:
             return None, f"Интерес «{interest}» недопустимой длины"
-        has_banned, word = contains_banned_words(interest, banned_words)
-        if has_banned:
+        if find_banned(key):
             return None, f"Интерес «{interest}» содержит недопустимое слово"
-    # удаляем дубликаты, сохраняя порядок
-    seen = set()
-    result: List[str] = []
-    for it in interests:
-        if it.lower() not in seen:
-            seen.add(it.lower())
-            result.append(it)
-    # итоговая длина строк
-    if sum(len(x) for x in result) > 300:
-        return None, "Суммарная длина интересов превышает 300 символов."
+        seen.add(key)
+        result.append(interest)
+        total += n
+        if total > 300:
+            return None, "Суммарная длина интересов превышает 300 символов."
     return result, None
@@ -8,4 +8,15 @@ import asyncio
 from app.bot import run_bot
 
 if __name__ == "__main__":
-    asyncio.run(run_bot())
+    # uvloop — опциональная зависимость (на Windows не ставится): быстрее стандартного цикла.
+    # Фабрика цикла передаётся в Runner напрямую: uvloop.install() (глобальная политика)
+    # устарел начиная с Python 3.12
+    try:
+        import uvloop
+    except ImportError:
+        loop_factory = None
+    else:
+        loop_factory = uvloop.new_event_loop
+
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(run_bot())
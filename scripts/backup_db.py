@@ -2,18 +2,46 @@
 """
 Скрипт для создания резервных копий SQLite базы данных.
 Особенности:
-- Использует VACUUM INTO для создания целостной копии
+- Копирует через онлайн-бэкап SQLite (Connection.backup): пишутся только живые
+  страницы, без перестройки файла и долгой блокировки, как у VACUUM INTO
+- Пропускает копирование, если БД не менялась с последнего бэкапа
 - Хранит бэкапы в формате YYYY-MM-DD.db
-- Удаляет копии старше 7 дней
+- Удаляет копии старше 7 дней (самая свежая копия сохраняется всегда)
 - Проверяет целостность после копирования
 """
 
 import os
+import re
 import sys
 import sqlite3
 from datetime import datetime, timedelta
 from pathlib import Path
 
+# Имя файла бэкапа: YYYY-MM-DD.db
+_BACKUP_NAME_RE = re.compile(r"\d{4}-\d{2}-\d{2}\.db")
+
+
+def _changed_since(src_path: Path, backup: Path) -> bool:
+    """Менялась ли БД (включая WAL-файл) после создания бэкапа backup."""
+    wal = src_path.with_name(src_path.name + "-wal")
+    src_mtime = max(p.stat().st_mtime for p in (src_path, wal) if p.exists())
+    return src_mtime >= backup.stat().st_mtime
+
+
+def _dated_backups(backup_dir: Path) -> list[tuple[str, Path]]:
+    """
+    Бэкапы с датой из имени (YYYY-MM-DD), от старых к новым; файлы с чужими
+    именами пропускаем. Даты в этом формате сравниваются как строки —
+    strptime и stat на каждый файл не нужны.
+    """
+    with os.scandir(backup_dir) as entries:
+        backups = [
+            (entry.name[:10], Path(entry.path))
+            for entry in entries
+            if _BACKUP_NAME_RE.fullmatch(entry.name)
+        ]
+    return sorted(backups)
+
 
 def backup_database(
     src_path: str | Path,
@@ -43,43 +71,57 @@ def backup_database(
     backup_path = backup_dir / f"{today}.db"
 
     try:
-        # Открываем исходную БД
-        src_conn = sqlite3.connect(src_path)
-
-        # Проверяем целостность перед копированием
-        src_check = src_conn.execute("PRAGMA integrity_check").fetchone()[0]
-        if src_check != "ok":
-            print(f"Ошибка: исходная БД повреждена: {src_check}")
-            sys.exit(1)
-
-        # Создаём бэкап через VACUUM INTO (атомарная операция)
-        src_conn.execute(f"VACUUM INTO '{backup_path}'")
-        src_conn.close()
-
-        # Проверяем целостность бэкапа
-        backup_conn = sqlite3.connect(backup_path)
-        backup_check = backup_conn.execute("PRAGMA integrity_check").fetchone()[0]
-        backup_conn.close()
-
-        if backup_check != "ok":
-            print(f"Ошибка: бэкап повреждён: {backup_check}")
-            backup_path.unlink()  # удаляем повреждённый файл
-            sys.exit(1)
-
-        print(f"Бэкап создан успешно: {backup_path}")
-
-        # Удаляем старые бэкапы
-        cutoff = datetime.now() - timedelta(days=days_to_keep)
-        for old_backup in backup_dir.glob("*.db"):
+        backups = _dated_backups(backup_dir)
+        latest = backups[-1][1] if backups else None
+
+        if latest is not None and not _changed_since(src_path, latest):
+            print(
+                f"БД не менялась с последнего бэкапа ({latest}), копирование пропущено"
+            )
+        else:
+            # Открываем исходную БД
+            src_conn = sqlite3.connect(src_path)
+
+            # Проверяем целостность перед копированием
+            src_check = src_conn.execute("PRAGMA integrity_check").fetchone()[0]
+            if src_check != "ok":
+                print(f"Ошибка: исходная БД повреждена: {src_check}")
+                sys.exit(1)
+
+            # Переносим закоммиченный WAL в основной файл и обрезаем его:
+            # бэкап читает компактную БД, а не длинную цепочку WAL-кадров
+            src_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+            # Онлайн-бэкап порциями по 1000 страниц: между порциями БД доступна
+            # на запись. Пишем во временный файл, чтобы оборванная копия
+            # не выглядела как готовый бэкап
+            tmp_path = backup_path.with_name(backup_path.name + ".tmp")
+            dst_conn = sqlite3.connect(tmp_path)
             try:
-                # Парсим дату из имени файла
-                backup_date = datetime.strptime(old_backup.stem, "%Y-%m-%d")
-                if backup_date < cutoff:
-                    old_backup.unlink()
-                    print(f"Удалён старый бэкап: {old_backup}")
-            except ValueError:
-                # Пропускаем файлы с неправильным форматом имени
-                continue
+                src_conn.backup(dst_conn, pages=1000, sleep=0.001)
+
+                # Проверяем целостность бэкапа
+                backup_check = dst_conn.execute("PRAGMA integrity_check").fetchone()[0]
+            finally:
+                dst_conn.close()
+                src_conn.close()
+
+            if backup_check != "ok":
+                print(f"Ошибка: бэкап повреждён: {backup_check}")
+                tmp_path.unlink()  # удаляем повреждённый файл
+                sys.exit(1)
+
+            tmp_path.replace(backup_path)
+            print(f"Бэкап создан успешно: {backup_path}")
+            backups = _dated_backups(backup_dir)
+
+        # Удаляем старые бэкапы, кроме самого свежего: при неизменной БД
+        # новые копии не появляются, и он остаётся единственным
+        cutoff = (datetime.now() - timedelta(days=days_to_keep)).strftime("%Y-%m-%d")
+        for backup_date, old_backup in backups[:-1]:
+            if backup_date <= cutoff:
+                old_backup.unlink()
+                print(f"Удалён старый бэкап: {old_backup}")
 
     except Exception as e:
         print(f"Ошибка при создании бэкапа: {e}")
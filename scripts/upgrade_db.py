@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Скрипт для обновления схемы существующей БД (SQLite/PostgreSQL) до app/models.py.
+Особенности:
+- create_all (DB_AUTO_CREATE) создаёт только недостающие таблицы: новые индексы,
+  ограничения и типы колонок в уже созданных таблицах он не трогает — это делает скрипт
+- URL БД и драйвер — те же, что у бота (DB_URL из .env, app.db.make_engine)
+- Все изменения — одна транзакция; операторы идемпотентны, повторный запуск безопасен
+- Перед изменениями проверяет данные, которые не пройдут новые ограничения
+- С флагом --sql только печатает DDL для своего диалекта, ничего не выполняя
+
+Перед запуском на SQLite сделайте бэкап (scripts/backup_db.py).
+"""
+
+import argparse
+import asyncio
+import sys
+import textwrap
+from pathlib import Path
+
+from sqlalchemy import text
+
+# запуск как `python scripts/upgrade_db.py` из корня проекта
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import Settings
+from app.db import make_engine
+
+# одинаковый синтаксис в SQLite и PostgreSQL
+_COMMON = (
+    # составной индекс по статусу и стадии вместо двух одиночных
+    "DROP INDEX IF EXISTS ix_users_status",
+    "DROP INDEX IF EXISTS ix_users_stage",
+    "CREATE INDEX IF NOT EXISTS ix_users_status_stage ON users (status, stage)",
+    # очистка просроченных: частичный индекс по неиспользованным кодам
+    "DROP INDEX IF EXISTS ix_otp_expires_at",
+    "CREATE INDEX IF NOT EXISTS ix_otp_live ON otp (expires_at) WHERE used_at IS NULL",
+    # последний код пользователя; одиночный индекс по user_id покрывается составным
+    "DROP INDEX IF EXISTS ix_otp_user_id",
+    "CREATE INDEX IF NOT EXISTS ix_otp_user_created ON otp (user_id, created_at)",
+    # дубли связей пользователь — роль (до uq_user_roles_user_role): оставляем первую
+    "DELETE FROM user_roles WHERE id NOT IN "
+    "(SELECT min(id) FROM user_roles GROUP BY user_id, role_id)",
+)
+
+_SQLITE = (
+    # e-mail уникален без учёта регистра. Старое UNIQUE(email) в SQLite без пересборки
+    # таблицы не снять, но оно строже не делает: его нарушение нарушает и lower-индекс
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_users_email_lower ON users (lower(email))",
+    *_COMMON,
+    # ON CONFLICT DO NOTHING в sync_admin_roles срабатывает на этом уникальном индексе
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_user_roles_user_role "
+    "ON user_roles (user_id, role_id)",
+)
+
+_POSTGRESQL = (
+    # e-mail уникален без учёта регистра: регистрозависимое ограничение заменяем индексом
+    "ALTER TABLE users DROP CONSTRAINT IF EXISTS users_email_key",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_users_email_lower ON users (lower(email))",
+    *_COMMON,
+    # в otp.code — hex-хеш кода (32 символа); SQLite длину varchar не проверяет
+    "ALTER TABLE otp ALTER COLUMN code TYPE varchar(64)",
+    # ограничение, на котором срабатывает ON CONFLICT DO NOTHING в sync_admin_roles;
+    # у ADD CONSTRAINT нет IF NOT EXISTS — проверяем сами
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_constraint WHERE conname = 'uq_user_roles_user_role'
+        ) THEN
+            ALTER TABLE user_roles
+                ADD CONSTRAINT uq_user_roles_user_role UNIQUE (user_id, role_id);
+        END IF;
+    END
+    $$
+    """,
+    # JSON-колонки — jsonb; уже переведённые не трогаем (USING переписал бы таблицу)
+    """
+    DO $$
+    DECLARE
+        col record;
+    BEGIN
+        FOR col IN
+            SELECT table_name, column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND data_type = 'json'
+              AND (table_name, column_name) IN (
+                  ('users', 'photos_json'),
+                  ('users', 'interests_json'),
+                  ('users', 'import_payload'),
+                  ('admin_log', 'payload')
+              )
+        LOOP
+            EXECUTE format(
+                'ALTER TABLE %I ALTER COLUMN %I TYPE jsonb USING %I::jsonb',
+                col.table_name, col.column_name, col.column_name
+            );
+        END LOOP;
+    END
+    $$
+    """,
+)
+
+_STATEMENTS = {"sqlite": _SQLITE, "postgresql": _POSTGRESQL}
+
+# адреса, различающиеся только регистром: с ними уникальный индекс не создать
+_DUPLICATE_EMAILS = text(
+    "SELECT lower(email), count(*) FROM users WHERE email IS NOT NULL "
+    "GROUP BY lower(email) HAVING count(*) > 1"
+)
+
+
+async def upgrade_database(settings: Settings) -> None:
+    """
+    Приводит схему БД из settings.db_url к app/models.py.
+
+    Args:
+        settings: Настройки бота (нужен db_url)
+    """
+    engine = make_engine(settings)
+    try:
+        statements = _STATEMENTS[engine.dialect.name]
+        async with engine.begin() as conn:
+            duplicates = (await conn.execute(_DUPLICATE_EMAILS)).all()
+            if duplicates:
+                print("Ошибка: e-mail, совпадающие без учёта регистра:")
+                for email, count in duplicates:
+                    print(f"  {email}: {count} пользователя(ей)")
+                print("Оставьте по одному адресу и запустите скрипт снова")
+                sys.exit(1)
+
+            for statement in statements:
+                await conn.execute(text(statement))
+        print(f"Схема БД обновлена ({engine.dialect.name})")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sql",
+        choices=sorted(_STATEMENTS),
+        help="только напечатать DDL для диалекта, без подключения к БД",
+    )
+    args = parser.parse_args()
+
+    if args.sql:
+        for statement in _STATEMENTS[args.sql]:
+            print(f"{textwrap.dedent(statement).strip()};")
+    else:
+        asyncio.run(upgrade_database(Settings.load()))